@@ -1,3 +1,175 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import throttling
+
+# Cada vista se ejecuta con su presupuesto de consultas activado
+TEST_SETTINGS = {
+    'QUERY_BUDGET_CHECKS': True,
+    'QUERY_BUDGET_STRICT': True,
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+}
+
+
+class AccountsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ana', email='ana@example.com', password='Secreta-123')
+
+    def setUp(self):
+        # Los contadores de los throttles no deben pasar de un test a otro
+        for cache in caches.all():
+            cache.clear()
+        throttling._local_blocks.clear()
+        self.api = APIClient()
+
+
+@override_settings(**TEST_SETTINGS)
+class AccountsApiTests(AccountsTestCase):
+    def test_register_api(self):
+        response = self.api.post(reverse('accounts:api_register'), {
+            'username': 'luis', 'email': 'luis@example.com',
+            'password': 'Secreta-456', 'password2': 'Secreta-456',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Token.objects.filter(user__username='luis', key=response.data['token']).exists())
+
+    def test_register_api_duplicate_email(self):
+        response = self.api.post(reverse('accounts:api_register'), {
+            'username': 'otra', 'email': 'ana@example.com',
+            'password': 'Secreta-456', 'password2': 'Secreta-456',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data['errors'])
+
+    def test_login_api(self):
+        response = self.api.post(reverse('accounts:api_login'), {'username': 'ana', 'password': 'Secreta-123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['token'], Token.objects.get(user=self.user).key)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_login_api_with_session(self):
+        response = self.api.post(reverse('accounts:api_login'), {
+            'username': 'ana', 'password': 'Secreta-123', 'session': 'true',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('sessionid', response.cookies)
+
+    def test_login_api_wrong_password(self):
+        response = self.api.post(reverse('accounts:api_login'), {'username': 'ana', 'password': 'mala'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_logout_api(self):
+        token = Token.objects.create(user=self.user)
+        self.api.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.api.post(reverse('accounts:api_logout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_profile_api(self):
+        token = Token.objects.create(user=self.user)
+        self.api.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.api.get(reverse('accounts:api_profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['username'], 'ana')
+
+    def test_profile_api_requires_token(self):
+        self.assertEqual(self.api.get(reverse('accounts:api_profile')).status_code, 401)
+
+    def test_check_username_api(self):
+        url = reverse('accounts:api_check_username')
+        self.assertFalse(self.api.get(url, {'username': 'ana'}).data['available'])
+        self.assertTrue(self.api.get(url, {'username': 'libre'}).data['available'])
+        self.assertEqual(self.api.get(url).status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS)
+class AccountsPageTests(AccountsTestCase):
+    def test_login_page(self):
+        self.assertEqual(self.client.get(reverse('accounts:login')).status_code, 200)
+
+        response = self.client.post(reverse('accounts:login'), {'username': 'ana', 'password': 'Secreta-123'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('accounts:logout'))
+        self.assertRedirects(response, reverse('accounts:login'), fetch_redirect_response=False)
+
+    def test_register_page(self):
+        self.assertEqual(self.client.get(reverse('accounts:register')).status_code, 200)
+
+        response = self.client.post(reverse('accounts:register'), {
+            'username': 'luis', 'email': 'luis@example.com', 'first_name': 'Luis', 'last_name': 'Pérez',
+            'password1': 'Secreta-456', 'password2': 'Secreta-456',
+        })
+        self.assertRedirects(response, reverse('accounts:login'), fetch_redirect_response=False)
+        self.assertTrue(User.objects.filter(username='luis').exists())
+
+
+@override_settings(**TEST_SETTINGS)
+class ThrottlingTests(AccountsTestCase):
+    # 15 s dentro de una ventana de un minuto
+    NOW = 60 * 1000 + 15
+
+    def setUp(self):
+        super().setUp()
+        self.timer = mock.patch.object(throttling.FixedWindowRateThrottle, 'timer', mock.Mock(return_value=self.NOW))
+        self.timer.start()
+        self.addCleanup(self.timer.stop)
+
+    def login(self):
+        return self.api.post(reverse('accounts:api_login'), {'username': 'ana', 'password': 'mala'})
+
+    def register(self, n):
+        return self.api.post(reverse('accounts:api_register'), {
+            'username': f'u{n}', 'email': f'u{n}@example.com', 'password': 'Secreta-456', 'password2': 'Secreta-456',
+        })
+
+    def test_login_is_throttled_until_the_window_ends(self):
+        # login: 10/min por IP
+        for _ in range(10):
+            self.assertEqual(self.login().status_code, 400)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '45')
+
+        throttling.FixedWindowRateThrottle.timer.return_value = self.NOW + 45
+        self.assertEqual(self.login().status_code, 400)
+
+    def test_scopes_are_independent(self):
+        for _ in range(11):
+            self.login()
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.register(0).status_code, 201)
+
+        # register: 5/hour por IP, desde otra IP para empezar de cero
+        self.api.defaults['REMOTE_ADDR'] = '10.0.0.2'
+        for n in range(1, 6):
+            self.assertEqual(self.register(n).status_code, 201)
+        self.assertEqual(self.register(6).status_code, 429)
+        response = self.api.post(reverse('accounts:api_login'), {'username': 'ana', 'password': 'Secreta-123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_blocked_client_does_not_touch_the_shared_cache(self):
+        for _ in range(11):
+            self.login()
+        self.assertIn('throttle_login_127.0.0.1', throttling._local_blocks)
+
+        with mock.patch.object(throttling.FixedWindowRateThrottle, 'increment') as increment:
+            self.assertEqual(self.login().status_code, 429)
+        increment.assert_not_called()
+
+        # En la siguiente ventana el bloqueo local se descarta
+        throttling.FixedWindowRateThrottle.timer.return_value = self.NOW + 45
+        self.assertEqual(self.login().status_code, 400)
+        self.assertNotIn('throttle_login_127.0.0.1', throttling._local_blocks)
@@ -0,0 +1,153 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+# Bloqueos conocidos por este worker: clave -> instante en que termina la
+# ventana. Evita consultar la caché compartida mientras un cliente ya está
+# bloqueado, de modo que un ataque de fuerza bruta no la sature.
+_local_blocks = {}
+_local_blocks_lock = threading.Lock()
+LOCAL_BLOCKS_MAX_SIZE = 10000
+
+
+class FixedWindowRateThrottle(SimpleRateThrottle):
+    """
+    Throttle de ventana fija basado en un contador atómico.
+
+    A diferencia de `SimpleRateThrottle`, que guarda en la caché la lista
+    completa de marcas de tiempo y la reescribe en cada petición, aquí cada
+    ventana es un único entero que se incrementa con `cache.incr` (O(1)).
+    El contador vive en el alias de caché `THROTTLE_CACHE_ALIAS`, que en
+    producción debe apuntar a un backend compartido (Redis/Memcached) para
+    que el límite sea el mismo en todos los workers y nodos.
+    """
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def get_cache_key(self, request, view):
+        """
+        Identifica al cliente por su usuario si está autenticado o por su IP.
+        """
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': ident
+        }
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.window_end = (window + 1) * self.duration
+
+        # Camino rápido: el cliente ya agotó su cuota en esta ventana
+        blocked_until = _local_blocks.get(self.key)
+        if blocked_until is not None:
+            if blocked_until > self.now:
+                return self.throttle_failure()
+            with _local_blocks_lock:
+                _local_blocks.pop(self.key, None)
+
+        count = self.increment(f'{self.key}_{window}')
+        if count > self.num_requests:
+            self.block_locally()
+            return self.throttle_failure()
+        return True
+
+    def increment(self, key):
+        """
+        Incrementa el contador de la ventana actual y devuelve su valor.
+        """
+        # Un segundo extra de vida cubre el desfase de reloj entre nodos
+        timeout = self.duration + 1
+        if self.cache.add(key, 1, timeout):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # La clave expiró entre `add` e `incr`
+            self.cache.set(key, 1, timeout)
+            return 1
+
+    def block_locally(self):
+        with _local_blocks_lock:
+            if len(_local_blocks) >= LOCAL_BLOCKS_MAX_SIZE:
+                expired = [key for key, until in _local_blocks.items() if until <= self.now]
+                for key in expired:
+                    del _local_blocks[key]
+                if len(_local_blocks) >= LOCAL_BLOCKS_MAX_SIZE:
+                    _local_blocks.clear()
+            _local_blocks[self.key] = self.window_end
+
+    def wait(self):
+        """
+        Segundos hasta que se abra la siguiente ventana (cabecera Retry-After).
+        """
+        return max(0, self.window_end - self.timer())
+
+
+class AnonCounterRateThrottle(FixedWindowRateThrottle):
+    """
+    Límite global para usuarios anónimos (scope `anon`).
+    """
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserCounterRateThrottle(FixedWindowRateThrottle):
+    """
+    Límite global para usuarios autenticados (scope `user`).
+    """
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class LoginRateThrottle(FixedWindowRateThrottle):
+    """
+    Límite para intentos de inicio de sesión por IP.
+    """
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class RegisterRateThrottle(LoginRateThrottle):
+    """
+    Límite para registros de nuevos usuarios por IP.
+    """
+    scope = 'register'
+
+
+class CheckUsernameRateThrottle(FixedWindowRateThrottle):
+    """
+    Límite para consultas de disponibilidad de nombre de usuario.
+    """
+    scope = 'check_username'
@@ -1,9 +1,11 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth import login, logout
+from django.contrib.auth.signals import user_logged_in
 from django.contrib.auth.models import User
 from .serializers import (
     UserRegistrationSerializer,
@@ -13,17 +15,26 @@ from .serializers import (
 from django.shortcuts import render, redirect
 from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import reverse_lazy
+from core.query_budget import query_budget
 from .forms import CustomUserCreationForm
+from .throttling import (
+    LoginRateThrottle,
+    RegisterRateThrottle,
+    CheckUsernameRateThrottle
+)
 
 class CustomLoginView(LoginView):
     template_name = 'registration/login.html'
     redirect_authenticated_user = True
+    # Includes creating and saving the session row (SESSION_STRATEGY 'db')
+    query_budget = 9
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['hide_sidebar'] = True
         return context
 
+@query_budget(3)
 def register_view(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -35,8 +46,10 @@ def register_view(request):
     return render(request, 'registration/register.html', {'form': form})
 
 
+@query_budget(7)
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterRateThrottle])
 def register_api(request):
     """
     Vista API para el registro de nuevos usuarios.
@@ -54,6 +67,7 @@ def register_api(request):
     Respuestas:
     - 201: Usuario creado exitosamente
     - 400: Error en validación de datos
+    - 429: Demasiadas peticiones (incluye cabecera Retry-After)
     """
     if request.method == 'POST':
         # Creamos el serializer con los datos recibidos
@@ -84,8 +98,17 @@ def register_api(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def wants_session(request):
+    """
+    Indica si el cliente pidió una sesión de Django además del token.
+    """
+    return str(request.data.get('session', '')).lower() in ('true', '1')
+
+
+@query_budget(13)
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginRateThrottle])
 def login_api(request):
     """
     Vista API para el inicio de sesión de usuarios.
@@ -95,10 +118,12 @@ def login_api(request):
     Parámetros esperados:
     - username: nombre de usuario
     - password: contraseña
+    - session: true para crear además una sesión de Django (opcional)
     
     Respuestas:
     - 200: Autenticación exitosa
     - 400: Error en credenciales
+    - 429: Demasiadas peticiones (incluye cabecera Retry-After)
     """
     if request.method == 'POST':
         # Creamos el serializer con los datos de login
@@ -111,8 +136,13 @@ def login_api(request):
             # Obtenemos el usuario validado
             user = serializer.validated_data['user']
             
-            # Iniciamos sesión en Django (opcional, para mantener sesión)
-            login(request, user)
+            # Iniciamos sesión en Django solo si se pide; los clientes que
+            # usan únicamente el token no necesitan una sesión
+            if settings.API_LOGIN_CREATES_SESSION or wants_session(request):
+                login(request, user)
+            else:
+                # Mantenemos la actualización de last_login que hace login()
+                user_logged_in.send(sender=user.__class__, request=request, user=user)
             
             # Creamos o obtenemos el token de autenticación
             token, created = Token.objects.get_or_create(user=user)
@@ -135,6 +165,7 @@ def login_api(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@query_budget(2)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_api(request):
@@ -169,6 +200,7 @@ def logout_api(request):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@query_budget(1)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_profile_api(request):
@@ -192,8 +224,10 @@ def user_profile_api(request):
         }, status=status.HTTP_200_OK)
 
 
+@query_budget(1)
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@throttle_classes([CheckUsernameRateThrottle])
 def check_username_api(request):
     """
     Vista API para verificar disponibilidad de nombre de usuario.
@@ -205,6 +239,7 @@ def check_username_api(request):
     
     Respuestas:
     - 200: Información sobre disponibilidad
+    - 429: Demasiadas peticiones (incluye cabecera Retry-After)
     """
     username = request.GET.get('username', '')
     
@@ -0,0 +1,54 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .models import ProfileRecord
+from .profiling import render_flamegraph
+
+
+@admin.register(ProfileRecord)
+class ProfileRecordAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms',
+                    'db_ms', 'upstream_ms', 'template_ms', 'trigger')
+    list_filter = ('trigger', 'view_name')
+    search_fields = ('path',)
+    date_hierarchy = 'created_at'
+    exclude = ('collapsed_stacks',)
+    readonly_fields = ('created_at', 'method', 'path', 'view_name', 'user', 'trigger', 'status_code',
+                       'duration_ms', 'samples', 'interval_ms', 'db_queries', 'db_ms', 'upstream_ms',
+                       'template_ms', 'collapsed_download', 'flamegraph')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/collapsed/', self.admin_site.admin_view(self.collapsed_view),
+                 name='core_profilerecord_collapsed'),
+        ] + super().get_urls()
+
+    def collapsed_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        record = get_object_or_404(ProfileRecord, pk=pk)
+        response = HttpResponse(record.collapsed_stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{pk}.collapsed"'
+        return response
+
+    @admin.display(description='Collapsed stacks')
+    def collapsed_download(self, obj):
+        url = reverse('admin:core_profilerecord_collapsed', args=[obj.pk])
+        return format_html('<a href="{}">Download</a> (flamegraph.pl, speedscope)', url)
+
+    @admin.display(description='Flamegraph')
+    def flamegraph(self, obj):
+        # Labels are escaped by render_flamegraph
+        svg = render_flamegraph(obj.collapsed_stacks)
+        return mark_safe(f'<div style="overflow-x: auto">{svg}</div>') if svg else '-'
@@ -2,4 +2,9 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'core'
\ No newline at end of file
+    name = 'core'
+
+    def ready(self):
+        # Registers the system checks and the receiver that pre-renders pages
+        # after a catalog sync
+        from . import checks, prerender  # noqa: F401
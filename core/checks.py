@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# What stops working across workers when each alias is per-process
+SHARED_CACHE_USES = {
+    'default': 'product cache invalidation, catalog snapshot versions, shared request coalescing '
+               'and the sync_catalog leader lock',
+    'throttle': 'request throttling',
+    # Only when SESSION_ENGINE keeps sessions in the cache
+    'sessions': 'logging out (the other workers keep a cached copy of the session)',
+}
+CACHED_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    warnings = []
+    for alias, uses in SHARED_CACHE_USES.items():
+        if alias == 'throttle':
+            alias = getattr(settings, 'THROTTLE_CACHE_ALIAS', alias)
+        elif alias == 'sessions':
+            if settings.SESSION_ENGINE not in CACHED_SESSION_ENGINES:
+                continue
+            alias = settings.SESSION_CACHE_ALIAS
+        if settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_CACHE_BACKENDS:
+            warnings.append(Warning(
+                f"The '{alias}' cache is local to each process.",
+                hint=f'With several workers or nodes each process has its own copy, which breaks {uses}. '
+                     'Point it at a shared backend such as Redis.',
+                id='core.W001',
+            ))
+    return warnings
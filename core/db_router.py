@@ -0,0 +1,86 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+# True while reads in the current request (or task) must go to the primary
+_pinned = ContextVar('pinned_to_primary', default=False)
+# True once the current request (or task) has written to the primary
+_wrote = ContextVar('wrote_to_primary', default=False)
+# True inside routing_scope(); outside one there is nothing to reset the
+# state above, so writes don't pin (threads and commands would stay pinned)
+_in_scope = ContextVar('in_routing_scope', default=False)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def has_written():
+    return _wrote.get()
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """
+    Fresh routing state for one unit of work, such as a request. Worker
+    threads are reused, so the state must not leak into the next one.
+    """
+    pinned_token = _pinned.set(pinned)
+    wrote_token = _wrote.set(False)
+    scope_token = _in_scope.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
+        _in_scope.reset(scope_token)
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary for the duration of the block."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to a random replica from DATABASE_REPLICAS and writes to the
+    primary. After the first write in a request, reads stick to the primary
+    so the client sees its own changes (see ReplicaPinningMiddleware).
+    Reads inside a transaction on the primary also go to the primary: they
+    usually decide what the transaction writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas or is_pinned() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if _in_scope.get():
+            _pinned.set(True)
+            _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,64 @@
+import socket
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+
+@contextmanager
+def leader_lock(name, timeout=3600):
+    """
+    Try to become the only node running the job called `name`.
+
+    Yields True if this process holds the lock. The lock only keeps two
+    nodes from running the job at the same time; periodic jobs also check
+    ran_recently() so that N nodes don't run it N times per interval. On Postgres this is a
+    session-level advisory lock, released when the block ends or the
+    connection dies; other databases fall back to an atomic `cache.add`
+    that expires after `timeout` seconds. So does DB_POOL_MODE=pgbouncer:
+    in transaction pooling consecutive queries may run on different server
+    connections, so the lock could be left held by a connection nobody
+    owns, or the unlock could go to one that never took it.
+    """
+    if connection.vendor == 'postgresql' and getattr(settings, 'DB_POOL_MODE', None) != 'pgbouncer':
+        key = zlib.crc32(name.encode())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+        return
+
+    cache_key = f'leader_lock_{name}'
+    owner = uuid.uuid4().hex
+    acquired = cache.add(cache_key, owner, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(cache_key) == owner:
+            cache.delete(cache_key)
+
+
+def ran_recently(name, seconds):
+    """True if any node completed the job `name` less than `seconds` ago."""
+    from .models import JobRun
+
+    since = timezone.now() - timedelta(seconds=seconds)
+    return JobRun.objects.filter(name=name, last_success_at__gt=since).exists()
+
+
+def record_success(name):
+    from .models import JobRun
+
+    JobRun.objects.update_or_create(
+        name=name, defaults={'last_success_at': timezone.now(), 'node': socket.gethostname()}
+    )
@@ -0,0 +1,154 @@
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from products.models import Product
+
+CONFIGURATIONS = [
+    ('gunicorn defaults', ['--gunicorn-defaults']),
+    ('runprod', []),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests the app under gunicorn with its default settings and with the runprod '
+        'configuration, and compares throughput and latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=20, help='Seconds of load per configuration')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='Path to request, can be repeated (default: home, product list and the '
+                                 'details of every product)')
+        parser.add_argument('--startup-timeout', type=float, default=60,
+                            help='Seconds to wait for each server to accept requests')
+
+    def handle(self, *args, **options):
+        if settings.UPSTREAM_MODE != 'replay':
+            self.stderr.write(self.style.WARNING(
+                'UPSTREAM_MODE is not "replay": results depend on the live API. '
+                'Record a snapshot with record_upstream for repeatable runs.'
+            ))
+        if (os.cpu_count() or 1) < 4:
+            self.stderr.write(self.style.WARNING(
+                f'Only {os.cpu_count() or 1} CPU(s): the clients compete with the server for them, '
+                'so the results understate what more workers and threads can do.'
+            ))
+        urls = options['urls'] or self.default_urls()
+
+        results = []
+        for name, arguments in CONFIGURATIONS:
+            self.stdout.write(f'{name}: {options["duration"]:.0f}s with {options["concurrency"]} clients...')
+            results.append((name, self.benchmark(arguments, urls, options)))
+
+        self.stdout.write(f'\n{"":<20} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for name, result in results:
+            self.stdout.write(
+                f'{name:<20} {result["rate"]:>8.1f} {result["p50"]:>8.1f} {result["p95"]:>8.1f} '
+                f'{result["p99"]:>8.1f} {result["errors"]:>7}'
+            )
+        baseline, tuned = results[0][1], results[1][1]
+        if baseline['rate']:
+            self.stdout.write(self.style.SUCCESS(
+                f'runprod: {tuned["rate"] / baseline["rate"]:.1f}x the throughput of the defaults.'
+            ))
+
+    def default_urls(self):
+        # Every product, as real traffic does: the details that aren't cached
+        # yet are what makes requests wait for the API
+        ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        return ['/', reverse('product_list')] + [reverse('product_detail', args=[pk]) for pk in ids]
+
+    def benchmark(self, arguments, urls, options):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runprod',
+             '--bind', f'127.0.0.1:{port}', *arguments],
+            cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            self.wait_until_ready(process, base_url, options['startup_timeout'])
+            return self.load(base_url, urls, options['duration'], options['concurrency'])
+        finally:
+            process.terminate()
+            try:
+                process.wait(settings.SERVER_TIMEOUT + 5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def wait_until_ready(self, process, base_url, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'The server exited with status {process.returncode}.')
+            try:
+                requests.get(base_url, timeout=5)
+                return
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.2)
+        raise CommandError(f'The server did not start within {timeout:.0f}s.')
+
+    def load(self, base_url, urls, duration, concurrency):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client(seed):
+            nonlocal errors
+            rng = random.Random(seed)
+            # Closed at the end so no idle keep-alive connection delays the server's shutdown
+            with requests.Session() as session:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        ok = session.get(base_url + rng.choice(urls), timeout=30).status_code < 500
+                    except requests.exceptions.RequestException:
+                        ok = False
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if ok:
+                            latencies.append(elapsed)
+                        else:
+                            errors += 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(client, range(concurrency)))
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        if not latencies:
+            return {'rate': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'errors': errors}
+        return {
+            'rate': len(latencies) / elapsed,
+            'p50': statistics.median(latencies) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'errors': errors,
+        }
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from products.analytics import DEFAULT_BINS, get_price_stats
+
+
+class Command(BaseCommand):
+    help = 'Prints price statistics for the local catalog, overall and per category'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=DEFAULT_BINS,
+                            help='Number of price histogram bins')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the full statistics as JSON')
+
+    def handle(self, *args, **options):
+        stats = get_price_stats(options['bins'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        if stats['overall'] is None:
+            self.stdout.write(self.style.WARNING('The local catalog is empty. Run sync_catalog first.'))
+            return
+
+        self.stdout.write(f'{"Category":<30} {"Count":>6} {"Min":>10} {"Mean":>10} {"Median":>10} {"Max":>10}')
+        rows = [{'name': 'All products', **stats['overall']}] + stats['categories']
+        for row in rows:
+            self.stdout.write(
+                f'{row["name"][:30]:<30} {row["count"]:>6} {row["min"]:>10.2f} {row["mean"]:>10.2f} '
+                f'{row["percentiles"]["p50"]:>10.2f} {row["max"]:>10.2f}'
+            )
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Exports the local catalog as CSV, JSONL or the columnar pcat format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=catalog_io.FORMATS, default='csv')
+        parser.add_argument('--output', '-o',
+                            help='Destination file (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=catalog_io.CHUNK_SIZE,
+                            help='Rows fetched from the database and written per chunk')
+
+    def handle(self, *args, **options):
+        chunks = catalog_io.export_catalog(options['format'], options['chunk_size'])
+
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options['output'], 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {written} bytes to {options["output"]}.'))
@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Imports products from a CSV, JSONL or pcat file into the local catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='File format (default: taken from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products inserted per statement')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or os.path.splitext(options['path'])[1].lstrip('.')
+        if fmt not in catalog_io.FORMATS:
+            raise CommandError(f'Unknown format "{fmt}". Use --format with one of: {", ".join(catalog_io.FORMATS)}')
+
+        try:
+            with open(options['path'], 'rb') as f:
+                stats = catalog_io.import_catalog(
+                    f, fmt,
+                    batch_size=options['batch_size'],
+                    log=lambda message: self.stdout.write(self.style.WARNING(message)),
+                )
+        except catalog_io.CatalogFormatError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats["imported"]} products, skipped {stats["skipped"]} invalid rows.'
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.prerender import prerender_pages
+
+
+class Command(BaseCommand):
+    help = (
+        'Pre-renders the home, login and register pages and the most visited product lists '
+        'for anonymous visitors. Run it after collectstatic on every deploy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default=settings.PRERENDER_ROOT,
+                            help='Directory to write the pages to (default: PRERENDER_ROOT)')
+        parser.add_argument('--product-list', action='append', dest='product_lists',
+                            help='Product list URL to pre-render, can be repeated (default: PRERENDER_PRODUCT_LISTS)')
+
+    def handle(self, *args, **options):
+        manifest = prerender_pages(options['output'], product_lists=options['product_lists'])
+        for url, page in manifest.items():
+            notes = ', '.join(page['encodings']) or 'CSRF token per request'
+            self.stdout.write(f'{url} -> {page["file"]}.html ({notes})')
+        self.stdout.write(self.style.SUCCESS(f'{len(manifest)} pages pre-rendered to {options["output"]}.'))
@@ -0,0 +1,30 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import outbox
+
+
+class Command(BaseCommand):
+    help = 'Applies queued product changes (create/edit/delete) to the Platzi Fake Store API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of concurrent upstream requests (default: PRODUCT_OUTBOX_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Mutations fetched from the outbox per round')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds between polls in --loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            applied = outbox.process_pending(options['workers'], options['batch_size'])
+            if applied:
+                self.stdout.write(self.style.SUCCESS(f'Applied {applied} product changes.'))
+            if not options['loop']:
+                break
+            # Jitter keeps several workers from polling in lockstep
+            time.sleep(options['interval'] * random.uniform(0.8, 1.2))
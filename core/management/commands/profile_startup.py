@@ -0,0 +1,78 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: this process has already imported everything
+BOOT_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+phases = {}
+from django.conf import settings
+settings.INSTALLED_APPS
+phases['settings'] = time.perf_counter() - started
+import django
+django.setup()
+phases['apps ready'] = time.perf_counter() - started
+from django.core.handlers.wsgi import WSGIHandler
+WSGIHandler()
+phases['middleware'] = time.perf_counter() - started
+from django.urls import get_resolver
+get_resolver().url_patterns
+phases['urls and views'] = time.perf_counter() - started
+if sys.argv[1] == 'warmup':
+    from core.warmup import warm_up
+    warm_up()
+    phases['warm-up'] = time.perf_counter() - started
+print(json.dumps(phases))
+'''
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Reports per-module import cost and the time each startup phase takes in a fresh process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of modules and packages to list')
+        parser.add_argument('--warmup', action='store_true',
+                            help='Also time the worker warm-up')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'platzi_store_app.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT, 'warmup' if options['warmup'] else '-'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+        packages = {}
+        for name, self_us, _, _ in modules:
+            top_level = name.split('.')[0]
+            packages[top_level] = packages.get(top_level, 0) + self_us
+
+        self.stdout.write('Startup phases (cumulative):')
+        for phase, seconds in json.loads(result.stdout.splitlines()[-1]).items():
+            self.stdout.write(f'  {phase:<16} {seconds * 1000:8.1f} ms')
+
+        self.stdout.write(f'\nSlowest imports (including their dependencies), {len(modules)} modules imported:')
+        top_imports = [m for m in modules if m[3] == 0]
+        for name, _, cumulative_us, _ in sorted(top_imports, key=lambda m: -m[2])[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+
+        self.stdout.write('\nImport time per package (own code only):')
+        for name, self_us in sorted(packages.items(), key=lambda p: -p[1])[:options['top']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f} ms  {name}')
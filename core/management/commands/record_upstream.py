@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products import replay, upstream
+from products.sync import fetch_all_products, fetch_json
+
+
+class Command(BaseCommand):
+    help = 'Records the Platzi Fake Store API responses the app uses into an upstream snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default=settings.UPSTREAM_SNAPSHOT_PATH,
+                            help='Snapshot file to write (default: UPSTREAM_SNAPSHOT_PATH)')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Page size to record; sync_catalog must use the same one in replay mode')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Maximum number of requests in flight')
+        parser.add_argument('--no-details', action='store_true',
+                            help="Don't record the individual product pages")
+
+    def handle(self, *args, **options):
+        if settings.UPSTREAM_MODE == 'replay':
+            raise CommandError('Cannot record while UPSTREAM_MODE is "replay".')
+
+        adapter = replay.RecordingAdapter(upstream.BASE_URL)
+        upstream.session.mount(upstream.BASE_URL, adapter)
+        try:
+            categories = fetch_json('categories')
+            products = fetch_all_products(options['page_size'], options['concurrency'])
+            # The unfiltered and per-category lists used by the product list view
+            paths = ['products'] + [f'products?categoryId={c["id"]}' for c in categories if 'id' in c]
+            if not options['no_details']:
+                paths += [f'products/{p["id"]}' for p in products if 'id' in p]
+
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                failures = sum(pool.map(self.record, paths))
+        except requests.exceptions.RequestException as e:
+            raise CommandError(f'Error reading the API: {e}')
+        finally:
+            upstream.session.mount(upstream.BASE_URL, upstream.replay_adapter or requests.adapters.HTTPAdapter())
+
+        adapter.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recorded {len(adapter.entries)} responses to {options["output"]} ({failures} failed requests).'
+        ))
+
+    def record(self, path):
+        # Error responses are recorded too, so replay reproduces them
+        try:
+            upstream.session.get(f'{upstream.BASE_URL}{path}', timeout=30)
+        except requests.exceptions.RequestException as e:
+            self.stderr.write(self.style.WARNING(f'{path}: {e}'))
+            return 1
+        return 0
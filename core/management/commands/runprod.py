@@ -0,0 +1,78 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from gunicorn.app.base import BaseApplication
+
+from core import server
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Importing the WSGI module also warms the app up (WORKER_WARMUP)
+        from platzi_store_app.wsgi import application
+        return application
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the app under gunicorn with a preloaded app, threaded workers sized from the CPU count '
+        'and the measured API latency, and worker recycling'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', '-b', default=settings.SERVER_BIND,
+                            help='Address to listen on (default: SERVER_BIND)')
+        parser.add_argument('--workers', type=int, help='Number of worker processes (default: computed)')
+        parser.add_argument('--threads', type=int, help='Threads per worker (default: computed)')
+        parser.add_argument('--max-requests', type=int,
+                            help='Requests before a worker is recycled, 0 to never (default: SERVER_MAX_REQUESTS)')
+        parser.add_argument('--gunicorn-defaults', action='store_true',
+                            help="Use gunicorn's own defaults (one sync worker) instead, for comparison")
+        parser.add_argument('--print-config', action='store_true',
+                            help='Print the configuration and exit')
+
+    def handle(self, *args, **options):
+        if options['gunicorn_defaults']:
+            config = {}
+            gunicorn_options = {'bind': options['bind']}
+        else:
+            config = server.server_config(
+                upstream_latency=server.measure_upstream_latency(),
+                request_costs=server.profiled_request_costs(),
+            )
+            for key in ('workers', 'threads', 'max_requests'):
+                if options[key] is not None:
+                    config[key] = options[key]
+            gunicorn_options = {
+                'bind': options['bind'],
+                'worker_class': 'gthread',
+                'workers': config['workers'],
+                'threads': config['threads'],
+                'max_requests': config['max_requests'],
+                'max_requests_jitter': config['max_requests_jitter'] if config['max_requests'] else 0,
+                'timeout': settings.SERVER_TIMEOUT,
+                'preload_app': True,
+                'when_ready': server.when_ready,
+                'post_fork': server.post_fork,
+            }
+
+        if options['print_config']:
+            self.stdout.write(json.dumps(config, indent=2))
+            return
+        if config:
+            self.stdout.write(
+                f'{config["workers"]} workers x {config["threads"]} threads '
+                f'({config["request_wait_ms"]} ms waiting per {config["request_cpu_ms"]} ms of CPU, '
+                f'from the {config["sized_from"]}), '
+                f'recycled after {config["max_requests"]} requests'
+            )
+        ProductionServer(gunicorn_options).run()
@@ -0,0 +1,100 @@
+import os
+import random
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.locks import leader_lock, ran_recently, record_success
+from products.sync import sync_catalog
+
+
+class Command(BaseCommand):
+    help = 'Keeps the local catalog in sync with the Platzi Fake Store API on a schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=300,
+                            help='Seconds between syncs')
+        parser.add_argument('--jitter', type=float, default=0.1,
+                            help='Random fraction added to or removed from each interval')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single sync and exit')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Products requested per page')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Maximum number of page requests in flight')
+        parser.add_argument('--metrics-file',
+                            help='Write Prometheus metrics to this file (node_exporter textfile collector)')
+
+    def handle(self, *args, **options):
+        self.metrics = {
+            'catalog_sync_runs_total': 0,
+            'catalog_sync_failures_total': 0,
+        }
+        self.last_success = None
+
+        while True:
+            close_old_connections()
+            self.sync_round(options)
+            self.write_metrics(options['metrics_file'])
+
+            if options['once']:
+                break
+            jitter = random.uniform(-options['jitter'], options['jitter'])
+            time.sleep(max(1.0, options['interval'] * (1 + jitter)))
+
+    def sync_round(self, options):
+        # Shorter than the gap between two of our own rounds, so only syncs
+        # by other nodes make us skip one
+        min_gap = options['interval'] * (1 - options['jitter']) * 0.9
+        with leader_lock('catalog_sync', timeout=int(options['interval'] * 2)) as leader:
+            if not leader:
+                self.stdout.write('Another node is syncing the catalog, skipping this round.')
+            elif not options['once'] and ran_recently('catalog_sync', min_gap):
+                self.stdout.write('Another node synced the catalog recently, skipping this round.')
+            else:
+                self.run_sync(options)
+
+    def run_sync(self, options):
+        started_at = time.time()
+        self.metrics['catalog_sync_runs_total'] += 1
+        try:
+            stats = sync_catalog(
+                page_size=options['page_size'],
+                concurrency=options['concurrency'],
+                log=lambda message: self.stdout.write(self.style.WARNING(message)),
+            )
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.metrics['catalog_sync_failures_total'] += 1
+            self.stderr.write(self.style.ERROR(f'Catalog sync failed: {e}'))
+            return
+
+        self.last_success = started_at
+        record_success('catalog_sync')
+        self.metrics['catalog_sync_duration_seconds'] = stats['duration']
+        for key in ('categories_created', 'categories_updated',
+                    'products_created', 'products_updated', 'products_deleted'):
+            self.metrics[f'catalog_sync_{key}'] = stats[key]
+        self.stdout.write(self.style.SUCCESS(
+            f'Catalog synced in {stats["duration"]:.2f}s: '
+            f'{stats["products_created"]} created, {stats["products_updated"]} updated, '
+            f'{stats["products_deleted"]} deleted products.'
+        ))
+
+    def write_metrics(self, path):
+        if not path:
+            return
+
+        metrics = dict(self.metrics)
+        if self.last_success is not None:
+            metrics['catalog_sync_last_success_timestamp_seconds'] = self.last_success
+            # The mirror can be at most this old compared with the API
+            metrics['catalog_sync_lag_seconds'] = time.time() - self.last_success
+
+        lines = [f'{name} {value}' for name, value in sorted(metrics.items())]
+        # Write then rename so the collector never reads a partial file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
@@ -0,0 +1,241 @@
+import logging
+import re
+import secrets
+import time
+from contextlib import ExitStack
+from gzip import GzipFile
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import StreamingBuffer, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .db_router import has_written, routing_scope
+
+logger = logging.getLogger(__name__)
+
+
+class DBTimingReport:
+    """Accumulates connection setup and query time for a single request."""
+
+    def __init__(self):
+        self.connects = 0
+        self.connect_time = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+    def track_connect(self, connection):
+        ensure_connection = connection.ensure_connection
+
+        def timed_ensure_connection():
+            if connection.connection is not None:
+                return ensure_connection()
+            start = time.perf_counter()
+            try:
+                return ensure_connection()
+            finally:
+                self.connects += 1
+                self.connect_time += time.perf_counter() - start
+
+        connection.ensure_connection = timed_ensure_connection
+        # Removing the instance attribute restores the class method
+        return lambda: connection.__dict__.pop('ensure_connection', None)
+
+    def server_timing(self):
+        return (
+            f'db-connect;dur={self.connect_time * 1000:.1f};desc="{self.connects} connects", '
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"'
+        )
+
+
+class DBTimingMiddleware:
+    """
+    Reports how much of each request was spent opening database connections
+    and running queries, through a Server-Timing header and the
+    ``core.middleware`` logger. With persistent or pooled connections the
+    connect figure should stay at zero on warm workers.
+
+    Streaming responses get no header: it has to be sent before the body,
+    whose queries run later, so it would report only part of the request.
+
+    Enabled by the DB_TIMING_REPORT setting.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DB_TIMING_REPORT', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        report = DBTimingReport()
+        with ExitStack() as stack:
+            for alias in connections:
+                connection = connections[alias]
+                stack.enter_context(connection.execute_wrapper(report.record_query))
+                stack.callback(report.track_connect(connection))
+            response = self.get_response(request)
+
+        if not response.streaming:
+            response['Server-Timing'] = report.server_timing()
+        logger.debug(
+            '%s %s: %d connects (%.1f ms), %d queries (%.1f ms)%s',
+            request.method, request.path,
+            report.connects, report.connect_time * 1000,
+            report.queries, report.query_time * 1000,
+            ' before streaming' if response.streaming else '',
+        )
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes stickiness across requests.
+
+    Once a request writes to the primary, the response sets a short-lived
+    cookie; while it is present the client's reads also go to the primary,
+    giving the replicas REPLICA_PIN_SECONDS to catch up.
+    """
+    cookie_name = 'db_pin'
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_scope(pinned=self.cookie_name in request.COOKIES):
+            response = self.get_response(request)
+            if has_written():
+                response.set_cookie(
+                    self.cookie_name, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+        return response
+
+
+COMPRESSIBLE_CONTENT_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+
+def parse_accept_encoding(header):
+    """Return a dict of coding -> q-value from an Accept-Encoding header."""
+    preferences = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        preferences[coding] = quality
+    return preferences
+
+
+def compress_sequence(sequence, max_random_bytes=None):
+    """
+    django.utils.text.compress_sequence, but flushed after every chunk so
+    the client gets each one as soon as it is produced.
+    """
+    buffer = StreamingBuffer()
+    # Random padding in the header, as Django does against BREACH
+    filename = b'a' * secrets.randbelow(max_random_bytes) if max_random_bytes else None
+    with GzipFile(filename=filename, mode='wb', compresslevel=6, fileobj=buffer, mtime=0) as zfile:
+        yield buffer.read()
+        for chunk in sequence:
+            zfile.write(chunk)
+            zfile.flush()
+            data = buffer.read()
+            if data:
+                yield data
+    yield buffer.read()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Django's GZipMiddleware, including its BREACH mitigation (a random
+    amount of padding in the gzip header), with these changes:
+
+    - q-values in Accept-Encoding are honoured, so ``gzip;q=0`` turns it off;
+    - only text types are compressed, and regular responses only from
+      COMPRESSION_MIN_SIZE bytes;
+    - streaming responses are flushed after every chunk so the browser can
+      start rendering before the stream ends;
+    - with the optional ``brotli`` package, brotli is used for regular
+      responses that contain no CSRF token. Brotli has no header to pad,
+      so pages with a token (and streaming ones, which may render one
+      later) always get gzip.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 500)
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def process_response(self, request, response):
+        if (response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(COMPRESSIBLE_CONTENT_TYPES)
+                or getattr(response, 'is_async', False)):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        encodings = self.encodings
+        if response.streaming or request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            encodings = ('gzip',)
+        encoding = self.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), encodings)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content, self.max_random_bytes)
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=5)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The compressed body is not byte-for-byte the original one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def choose_encoding(self, accept_encoding, encodings):
+        preferences = parse_accept_encoding(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in encodings:
+            quality = preferences.get(encoding, preferences.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db import models
+
+
+class ProfileRecord(models.Model):
+    """Sampling profile of one request, taken by core.profiling.ProfilingMiddleware."""
+    MANUAL = 'manual'
+    SAMPLED = 'sampled'
+    TRIGGER_CHOICES = [
+        (MANUAL, 'Requested'),
+        (SAMPLED, 'Sampled'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.SET_NULL)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField()
+    interval_ms = models.PositiveIntegerField()
+    db_queries = models.PositiveIntegerField()
+    db_ms = models.FloatField()
+    # Estimated from the share of samples inside requests/urllib3 and
+    # django.template frames
+    upstream_ms = models.FloatField()
+    template_ms = models.FloatField()
+    # One 'frame;frame;frame count' line per distinct stack
+    collapsed_stacks = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} ms)'
+
+
+class JobRun(models.Model):
+    """Last successful run of a periodic job, shared by every node (see core.locks)."""
+    name = models.CharField(max_length=100, unique=True)
+    last_success_at = models.DateTimeField()
+    node = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f'{self.name} @ {self.last_success_at}'
@@ -0,0 +1,247 @@
+"""
+Pre-rendered pages for anonymous visitors.
+
+``prerender_pages()`` (the prerender_pages command, and every catalog sync)
+renders the pages in PRERENDER_PAGES and the product lists in
+PRERENDER_PRODUCT_LISTS as an anonymous user and stores them under
+PRERENDER_ROOT, together with gzip and brotli copies and a manifest.
+
+``PrerenderedPageMiddleware`` answers GET requests for those URLs straight
+from the files, without resolving the URL, running the view or rendering a
+template, as long as the visitor is anonymous and has no pending messages.
+Everyone else gets the dynamic page.
+
+Pages with forms keep a placeholder where the CSRF token goes and get a
+fresh token per request (they are compressed by CompressionMiddleware
+instead of served precompressed). Product lists record a digest of the
+catalog snapshot they were rendered from and are only served while the
+worker's snapshot still has the same contents.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage import default_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from products import prefetch
+from products.signals import catalog_synced
+from products.snapshot import filter_snapshot, get_list_snapshot, get_snapshot
+
+from .middleware import brotli, parse_accept_encoding
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+CSRF_PLACEHOLDER = '__prerendered_csrf_token__'
+CSRF_INPUT = re.compile(r'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def page_key(path, query_string=''):
+    """Path plus the query parameters in a canonical order."""
+    query = urlencode(sorted(parse_qsl(query_string, keep_blank_values=True)))
+    return f'{path}?{query}' if query else path
+
+
+def render_page(url):
+    """
+    The HTML of `url` as an anonymous visitor sees it, or None if the page
+    can't be pre-rendered (not a 200, or the view added a message).
+    """
+    # Only needed when rendering, which happens outside the web workers
+    from django.test import RequestFactory
+
+    request = RequestFactory().get(url)
+    request.user = AnonymousUser()
+    request._messages = default_storage(request)
+    match = resolve(request.path_info)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+
+    if response.streaming:
+        body = b''.join(response.streaming_content)
+    else:
+        body = response.content
+    if response.status_code != 200 or len(get_messages(request)):
+        return None
+    return body.decode(response.charset)
+
+
+def write_page(root, html):
+    """Store `html` (and its compressed copies) under a content-addressed name."""
+    name = hashlib.sha256(html.encode()).hexdigest()[:20]
+    data = html.encode()
+    encodings = []
+    (root / f'{name}.html').write_bytes(data)
+    if CSRF_PLACEHOLDER not in html:
+        (root / f'{name}.html.gz').write_bytes(gzip.compress(data, 9, mtime=0))
+        encodings.append('gzip')
+        if brotli is not None:
+            (root / f'{name}.html.br').write_bytes(brotli.compress(data, quality=11))
+            encodings.append('br')
+    return name, encodings
+
+
+def prerender_pages(root=None, pages=None, product_lists=None):
+    """
+    Render the pages and product lists into `root` and switch the manifest
+    over to them. Returns the manifest.
+    """
+    root = Path(root or settings.PRERENDER_ROOT)
+    pages = settings.PRERENDER_PAGES if pages is None else pages
+    product_lists = settings.PRERENDER_PRODUCT_LISTS if product_lists is None else product_lists
+    root.mkdir(parents=True, exist_ok=True)
+
+    snapshot = None
+    if product_lists:
+        get_snapshot(revalidate=True)
+        # Without a snapshot the lists come from the API and can't be checked
+        snapshot = get_list_snapshot()
+        if snapshot is None:
+            logger.warning('No catalog snapshot, product lists are not pre-rendered')
+            product_lists = []
+
+    manifest = {}
+    for url, is_product_list in [(u, False) for u in pages] + [(u, True) for u in product_lists]:
+        html = render_page(url)
+        if html is None:
+            logger.warning('%s cannot be pre-rendered', url)
+            continue
+        html = CSRF_INPUT.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', html)
+        name, encodings = write_page(root, html)
+        parts = urlsplit(url)
+        page = {'file': name, 'encodings': encodings, 'csrf': CSRF_PLACEHOLDER in html}
+        if is_product_list:
+            page['catalog'] = snapshot.digest()
+            page['seed'] = [p.id for p in filter_snapshot(snapshot, dict(parse_qsl(parts.query)))]
+            page['seed'] = page['seed'][:settings.PRODUCT_DETAIL_SEED_LIMIT]
+        manifest[page_key(parts.path, parts.query)] = page
+
+    # Readers see either the old or the new manifest, never a partial one
+    tmp = root / f'{MANIFEST_NAME}.{os.getpid()}'
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, root / MANIFEST_NAME)
+
+    # Old files are removed once nothing points to them (a worker that still
+    # has the previous manifest falls back to rendering the page)
+    current = {page['file'] for page in manifest.values()}
+    for path in root.glob('*.html*'):
+        if path.name.split('.', 1)[0] not in current:
+            path.unlink(missing_ok=True)
+    return manifest
+
+
+@receiver(catalog_synced)
+def prerender_after_sync(sender, **kwargs):
+    if not settings.PRERENDER_ENABLED:
+        return
+    try:
+        prerender_pages()
+    except Exception:
+        logger.exception('Pre-rendering after the catalog sync failed')
+
+
+class PrerenderedPageMiddleware:
+    """
+    Serves the pre-rendered pages to anonymous visitors. Goes last in
+    MIDDLEWARE, so that the session, CSRF, messages and X-Frame-Options
+    middleware still see the request and the response.
+
+    Enabled by the PRERENDER_ENABLED setting.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PRERENDER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.root = Path(settings.PRERENDER_ROOT)
+        self.manifest = {}
+        self.manifest_mtime = None
+        self.files = {}
+
+    def __call__(self, request):
+        response = None
+        if request.method in ('GET', 'HEAD'):
+            response = self.prerendered(request)
+        return response if response is not None else self.get_response(request)
+
+    def load_manifest(self):
+        # A stat per request picks up a new manifest written by another process
+        try:
+            mtime = (self.root / MANIFEST_NAME).stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.manifest_mtime:
+            try:
+                self.manifest = json.loads((self.root / MANIFEST_NAME).read_text())
+            except (FileNotFoundError, ValueError):
+                self.manifest = {}
+            self.manifest_mtime = mtime
+            self.files = {}
+        return self.manifest
+
+    def read(self, filename):
+        # Names are content hashes, so a cached file never goes stale
+        data = self.files.get(filename)
+        if data is None:
+            data = self.files[filename] = (self.root / filename).read_bytes()
+        return data
+
+    def prerendered(self, request):
+        page = self.load_manifest().get(page_key(request.path, request.META.get('QUERY_STRING', '')))
+        if page is None or request.user.is_authenticated or len(get_messages(request)):
+            return None
+
+        snapshot = None
+        if 'catalog' in page:
+            snapshot = get_list_snapshot()
+            if snapshot is None or snapshot.digest() != page['catalog']:
+                return None
+
+        encoding = self.choose_encoding(request, page['encodings'])
+        filename = f'{page["file"]}.html' + {'gzip': '.gz', 'br': '.br', None: ''}[encoding]
+        try:
+            body = self.read(filename)
+        except FileNotFoundError:
+            return None
+
+        if page['csrf']:
+            body = body.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+        response = HttpResponse(body)
+        if not page['csrf']:
+            etag = f'"{page["file"]}"' if encoding is None else f'W/"{page["file"]}"'
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Accept-Encoding',))
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+            response = get_conditional_response(request, etag=etag, response=response) or response
+
+        if snapshot is not None and page['seed']:
+            # What product_list does for the products it shows
+            prefetch.seed_from_list(filter(None, map(snapshot.get, page['seed'])))
+        return response
+
+    def choose_encoding(self, request, encodings):
+        preferences = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        best, best_quality = None, 0.0
+        for encoding in ('br', 'gzip'):
+            if encoding not in encodings:
+                continue
+            quality = preferences.get(encoding, preferences.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
@@ -0,0 +1,272 @@
+"""
+On-demand sampling profiler for live requests.
+
+A staff user can profile a single request by sending the ``X-Profile: 1``
+header or the ``__profile=1`` query parameter; PROFILE_SAMPLE_RATES also
+profiles a random fraction of the requests to the views it names. At
+most PROFILE_MAX_PER_MINUTE requests are profiled per minute across all
+workers.
+
+While a request is profiled, a background thread samples its stack every
+PROFILE_INTERVAL_MS milliseconds (the request itself runs untouched, so
+the overhead is a few microseconds per sample). Stacks are stored as a
+ProfileRecord in collapsed format (``frame;frame;frame count``, as used
+by flamegraph.pl and speedscope) together with an estimate of the time
+spent waiting for the API, in the database and rendering templates; the
+admin shows them as a flamegraph.
+"""
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from html import escape
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import query_budget
+
+# Frames are attributed to the innermost of these modules on the stack
+CATEGORIES = (
+    ('upstream', ('requests.', 'urllib3.', 'http.client', 'ssl', 'socket')),
+    ('db', ('django.db.',)),
+    ('template', ('django.template.',)),
+)
+RATE_LIMIT_KEY = 'profiler_window_{}'
+
+
+def frame_name(frame):
+    return f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}'
+
+
+def collapse(frame):
+    """The stack ending at `frame` as 'outer;...;inner'."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def categorize(stack):
+    for name in reversed(stack.split(';')):
+        module = name.split(':', 1)[0] + '.'
+        for category, prefixes in CATEGORIES:
+            if module.startswith(prefixes):
+                return category
+    return 'python'
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of thread `thread_id` every `interval` seconds."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.started_at = None
+        self.duration = 0.0
+        self._stopped = threading.Event()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        super().start()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started_at
+        self._stopped.set()
+        self.join()
+
+    def breakdown(self):
+        """Estimated seconds per category, from the share of samples in each."""
+        total = sum(self.stacks.values())
+        seconds = Counter()
+        if total:
+            for stack, count in self.stacks.items():
+                seconds[categorize(stack)] += self.duration * count / total
+        return seconds
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+class DBTimer:
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.time += time.perf_counter() - start
+
+
+def parse_collapsed(text):
+    stacks = []
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks.append((stack.split(';'), int(count)))
+    return stacks
+
+
+def render_flamegraph(collapsed, width=1200, row_height=18):
+    """An SVG flamegraph (root at the top) of collapsed stacks."""
+    root = {'count': 0, 'children': {}}
+    for frames, count in parse_collapsed(collapsed):
+        root['count'] += count
+        node = root
+        for name in frames:
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+    if not root['count']:
+        return ''
+
+    rects = []
+    depth_reached = 0
+
+    def draw(node, x, depth):
+        nonlocal depth_reached
+        for name, child in sorted(node['children'].items()):
+            w = width * child['count'] / root['count']
+            if w >= 1:
+                depth_reached = max(depth_reached, depth)
+                y = depth * row_height
+                hue = 10 + zlib.crc32(name.split(':')[0].encode()) % 50
+                label = escape(name)
+                title = f'{label} ({child["count"]} samples, {child["count"] * 100 / root["count"]:.1f}%)'
+                text = label[:int(w / 7)] if w > 30 else ''
+                rects.append(
+                    f'<g><title>{title}</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},80%,60%)"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + row_height - 5}" font-size="11" font-family="monospace">{text}</text></g>'
+                )
+                draw(child, x, depth + 1)
+            x += w
+
+    draw(root, 0, 0)
+    height = (depth_reached + 1) * row_height
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">{"".join(rects)}</svg>'
+    )
+
+
+def allow_profile():
+    """Fixed one-minute window shared by every worker."""
+    cache = caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+    key = RATE_LIMIT_KEY.format(int(time.time() // 60))
+    if cache.add(key, 1, 60):
+        count = 1
+    else:
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            count = 1
+    return count <= settings.PROFILE_MAX_PER_MINUTE
+
+
+class ProfilingMiddleware:
+    """
+    Starts the sampler for requests that ask for it (staff only) or are
+    picked by PROFILE_SAMPLE_RATES, and stores the result once the response,
+    including a streamed body, is complete. Must come after
+    AuthenticationMiddleware.
+
+    Enabled by the PROFILING_ENABLED setting.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.finish_after_stream(request, response, response.streaming_content)
+        else:
+            self.finish(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trigger = self.trigger(request)
+        if trigger is None or not allow_profile():
+            return None
+
+        sampler = Sampler(threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000)
+        db_timer = DBTimer()
+        for alias in connections:
+            # First in the list: execute_wrapper() blocks of outer middleware
+            # pop the last wrapper when they exit, possibly mid-stream
+            connections[alias].execute_wrappers.insert(0, db_timer)
+        sampler.start()
+        request._profile = (trigger, sampler, db_timer)
+        return None
+
+    def trigger(self, request):
+        requested = (
+            request.headers.get('X-Profile') == '1'
+            or request.GET.get('__profile') == '1'
+        )
+        if requested and request.user.is_active and request.user.is_staff:
+            return 'manual'
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        rate = settings.PROFILE_SAMPLE_RATES.get(view_name, 0)
+        if rate and random.random() < rate:
+            return 'sampled'
+        return None
+
+    def finish_after_stream(self, request, response, content):
+        try:
+            yield from content
+        finally:
+            self.finish(request, response)
+
+    def finish(self, request, response):
+        from .models import ProfileRecord
+
+        trigger, sampler, db_timer = request._profile
+        sampler.stop()
+        for alias in connections:
+            wrappers = connections[alias].execute_wrappers
+            if db_timer in wrappers:
+                wrappers.remove(db_timer)
+
+        breakdown = sampler.breakdown()
+        user = request.user if request.user.is_authenticated else None
+        with query_budget.paused():
+            ProfileRecord.objects.create(
+                method=request.method,
+                path=request.get_full_path()[:500],
+                view_name=request.resolver_match.view_name if request.resolver_match else '',
+                user=user,
+                trigger=trigger,
+                status_code=response.status_code,
+                duration_ms=sampler.duration * 1000,
+                samples=sum(sampler.stacks.values()),
+                interval_ms=settings.PROFILE_INTERVAL_MS,
+                db_queries=db_timer.queries,
+                db_ms=db_timer.time * 1000,
+                upstream_ms=breakdown['upstream'] * 1000,
+                template_ms=breakdown['template'] * 1000,
+                collapsed_stacks=sampler.collapsed(),
+            )
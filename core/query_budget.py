@@ -0,0 +1,193 @@
+"""
+Query budgets: how many database queries a view (or any block of code) is
+allowed to run, plus detection of N+1 patterns (the same query shape
+repeated with different parameters).
+
+- ``@query_budget(n)`` declares the budget of a function-based view; for
+  class-based views set a ``query_budget`` class attribute. Budgets count
+  the whole request, including loading and saving the session with the
+  default 'db' SESSION_STRATEGY.
+- ``QueryBudgetMiddleware`` (QUERY_BUDGET_CHECKS, on in DEBUG) records the
+  queries of every request and logs budget overruns and N+1 patterns.
+  With QUERY_BUDGET_STRICT it raises QueryBudgetExceeded instead, which is
+  what the test suite uses.
+- ``assert_max_queries(n)`` is a context manager for tests and benchmarks.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Literals are replaced by '?' so queries that only differ in their
+# parameters share a shape
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view or block ran more queries than its budget, or an N+1 pattern."""
+
+
+_paused = ContextVar('query_budget_paused', default=False)
+
+
+@contextmanager
+def paused():
+    """Queries run inside this block are not recorded (instrumentation's own writes)."""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def query_shape(sql):
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    return _IN_LIST.sub('IN (...)', shape)
+
+
+class QueryRecorder:
+    """Records the SQL run on every database connection while active."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if not _paused.get():
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def start(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+
+    def stop(self):
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated_shapes(self, threshold):
+        """Query shapes that ran at least `threshold` times."""
+        counts = Counter(query_shape(sql) for sql in self.queries)
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+    def problems(self, budget=None, repeat_threshold=None):
+        """Human-readable descriptions of the budget and N+1 violations."""
+        problems = []
+        if budget is not None and len(self) > budget:
+            problems.append(f'{len(self)} queries, budget is {budget}')
+        if repeat_threshold:
+            for shape, count in self.repeated_shapes(repeat_threshold).items():
+                problems.append(f'possible N+1, {count} times: {shape}')
+        return problems
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of queries a function-based view may run.
+    Put it above @api_view and similar decorators so it marks the final
+    view callable.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def view_budget(view):
+    view_class = getattr(view, 'view_class', None) or getattr(view, 'cls', None)
+    return getattr(view, 'query_budget', getattr(view_class, 'query_budget', None))
+
+
+class assert_max_queries(QueryRecorder):
+    """
+    Context manager that raises QueryBudgetExceeded if the block runs more
+    than `max_queries` queries or repeats a query shape `repeat_threshold`
+    times.
+    """
+
+    def __init__(self, max_queries, repeat_threshold=None):
+        super().__init__()
+        self.max_queries = max_queries
+        self.repeat_threshold = repeat_threshold
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        if exc_type is None:
+            problems = self.problems(self.max_queries, self.repeat_threshold)
+            if problems:
+                raise QueryBudgetExceeded('; '.join(problems) + '\n' + '\n'.join(self.queries))
+
+
+class QueryBudgetMiddleware:
+    """
+    Checks every request against the query budget of its view and for
+    repeated query shapes. Streaming responses are checked once the stream
+    is consumed.
+
+    Enabled by the QUERY_BUDGET_CHECKS setting.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_CHECKS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        recorder.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            recorder.stop()
+            raise
+
+        if response.streaming:
+            response.streaming_content = self.check_after_stream(request, response.streaming_content, recorder)
+        else:
+            recorder.stop()
+            self.check(request, recorder)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_budget(view_func)
+
+    def check_after_stream(self, request, content, recorder):
+        try:
+            yield from content
+        finally:
+            recorder.stop()
+        self.check(request, recorder)
+
+    def check(self, request, recorder):
+        problems = recorder.problems(
+            getattr(request, 'query_budget', None),
+            settings.QUERY_BUDGET_REPEAT_THRESHOLD,
+        )
+        if not problems:
+            return
+        message = f'{request.method} {request.path}: ' + '; '.join(problems)
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message + '\n' + '\n'.join(recorder.queries))
+        logger.warning(message)
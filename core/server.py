@@ -0,0 +1,120 @@
+"""
+Production server configuration (python manage.py runprod).
+
+Gunicorn runs the app with threaded (gthread) workers and preloads it in
+the master process: settings, views, templates and, with WORKER_WARMUP,
+the catalog snapshot are loaded once and shared copy-on-write by every
+forked worker. The garbage collector is frozen before forking so that
+collections in the workers don't write to, and thereby copy, those pages.
+
+Each worker keeps one CPU busy when it has enough threads to cover the
+time its requests spend waiting (Little's law): threads = 1 + average wait
+per request / average CPU time per request. Most requests are answered from
+the catalog snapshot and the caches and never wait for the API, so the wait
+is an average over all requests, not the API latency: both figures come
+from the latest sampled profiles (wait = API + database time, CPU = the
+rest). Without enough profiles the CPU time is SERVER_REQUEST_CPU_MS and the
+wait the API latency measured at startup times SERVER_UPSTREAM_WAIT_SHARE.
+More threads than that only contend for the GIL, which is why the count is
+also capped by SERVER_MAX_THREADS. Workers are recycled after
+SERVER_MAX_REQUESTS requests, with jitter so they don't all restart at
+once, to cap memory growth.
+"""
+import gc
+import logging
+import math
+import os
+import random
+import statistics
+import time
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError
+
+from products import upstream
+
+logger = logging.getLogger(__name__)
+
+
+def measure_upstream_latency(samples=3):
+    """Median seconds for a small API request, or None if the API is unreachable."""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        try:
+            upstream.session.get(f'{upstream.BASE_URL}categories', timeout=10)
+        except requests.exceptions.RequestException as e:
+            logger.warning('Could not measure the API latency: %s', e)
+            return None
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def profiled_request_costs(limit=500):
+    """
+    (CPU seconds, waiting seconds) per request, averaged over the latest
+    sampled profiles, or None when there are fewer than
+    SERVER_SIZING_MIN_PROFILES of them.
+    """
+    from .models import ProfileRecord
+
+    try:
+        records = list(
+            ProfileRecord.objects.filter(trigger=ProfileRecord.SAMPLED)
+            .order_by('-created_at')
+            .values_list('duration_ms', 'upstream_ms', 'db_ms')[:limit]
+        )
+    except DatabaseError as e:
+        logger.warning('Could not read the request profiles: %s', e)
+        return None
+    if not records or len(records) < settings.SERVER_SIZING_MIN_PROFILES:
+        return None
+    waits = [upstream_ms + db_ms for _, upstream_ms, db_ms in records]
+    cpu = [max(0.0, duration - wait) for (duration, _, _), wait in zip(records, waits)]
+    return statistics.mean(cpu) / 1000, statistics.mean(waits) / 1000
+
+
+def server_config(cpus=None, upstream_latency=None, request_costs=None):
+    """
+    Worker, thread and recycling settings for this machine, from the
+    profiled `request_costs` (see profiled_request_costs) or else the
+    measured `upstream_latency`. SERVER_WORKERS and SERVER_THREADS override
+    the computed values when set.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    if upstream_latency is None:
+        upstream_latency = settings.SERVER_UPSTREAM_LATENCY_MS / 1000
+    if request_costs is not None:
+        cpu_time, wait = request_costs
+    else:
+        cpu_time = settings.SERVER_REQUEST_CPU_MS / 1000
+        wait = upstream_latency * settings.SERVER_UPSTREAM_WAIT_SHARE
+
+    # At least two workers, so a recycled or stuck one doesn't stop the site
+    workers = settings.SERVER_WORKERS or max(2, cpus)
+    threads = settings.SERVER_THREADS or min(
+        settings.SERVER_MAX_THREADS, max(1, math.ceil(round(1 + wait / max(cpu_time, 0.001), 6)))
+    )
+    return {
+        'workers': workers,
+        'threads': threads,
+        'max_requests': settings.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': settings.SERVER_MAX_REQUESTS // 10,
+        'upstream_latency_ms': round(upstream_latency * 1000, 1),
+        'request_cpu_ms': round(cpu_time * 1000, 1),
+        'request_wait_ms': round(wait * 1000, 1),
+        'sized_from': 'profiles' if request_costs is not None else 'estimate',
+    }
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any fork.
+    # Pooled API connections must not be shared by the workers.
+    upstream.session.close()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Otherwise every worker draws the same random numbers (profile sampling)
+    random.seed()
@@ -0,0 +1,44 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashed static files plus precompressed ``.gz`` (and ``.br`` when the
+    ``brotli`` package is installed) siblings, so the web server can send
+    them as-is with ``gzip_static``/``brotli_static`` and cache them forever.
+    """
+    compressible_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+    min_compress_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Only the names in the manifest are ever served; files that refer
+        # to others may also leave intermediate names from earlier passes
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(self.compressible_extensions):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < self.min_compress_size:
+            return
+
+        self.save_compressed(f'{name}.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self.save_compressed(f'{name}.br', brotli.compress(content, quality=11))
+
+    def save_compressed(self, name, data):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(data))
@@ -0,0 +1,693 @@
+import gc
+import gzip
+import json
+import os
+import runpy
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
+
+import requests
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.urls import reverse
+from django.utils import timezone
+from platzi_store_app import settings as settings_module
+from products.models import Category, Product
+from products.snapshot import bump_version
+
+from .checks import check_shared_caches
+from .db_router import PrimaryReplicaRouter, has_written, routing_scope, use_primary
+from .locks import leader_lock
+from .middleware import CompressionMiddleware, DBTimingMiddleware, DBTimingReport, ReplicaPinningMiddleware, brotli
+from .models import ProfileRecord
+from .prerender import CSRF_PLACEHOLDER, prerender_pages
+from .profiling import categorize, render_flamegraph
+from .query_budget import (
+    QueryBudgetExceeded, QueryBudgetMiddleware, assert_max_queries, paused, query_budget, query_shape,
+)
+from .server import profiled_request_costs, server_config, when_ready
+from .warmup import warm_up
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_replicas(self):
+        with routing_scope():
+            self.assertIn(self.router.db_for_read(User), ['replica_1', 'replica_2'])
+
+    def test_writes_go_to_primary(self):
+        with routing_scope():
+            self.assertEqual(self.router.db_for_write(User), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        with routing_scope():
+            self.router.db_for_write(User)
+            self.assertEqual(self.router.db_for_read(User), 'default')
+        with routing_scope():
+            self.assertNotEqual(self.router.db_for_read(User), 'default')
+
+    def test_writes_outside_a_scope_do_not_pin(self):
+        # Background threads and commands have no scope to reset the pin
+        self.router.db_for_write(User)
+        self.assertNotEqual(self.router.db_for_read(User), 'default')
+        self.assertFalse(has_written())
+
+    def test_reads_in_a_transaction_go_to_primary(self):
+        with mock.patch.object(connections['default'], 'in_atomic_block', True), routing_scope():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_use_primary(self):
+        with routing_scope(), use_primary():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_go_to_primary(self):
+        with routing_scope():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(self.router.allow_migrate('default', 'auth'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'auth'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_PIN_SECONDS=5)
+class ReplicaPinningMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_write_sets_pin_cookie(self):
+        def view(request):
+            self.router.db_for_write(User)
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(view)(self.factory.post('/'))
+        self.assertEqual(response.cookies['db_pin']['max-age'], 5)
+
+    def test_pin_cookie_routes_reads_to_primary(self):
+        def view(request):
+            return HttpResponse(self.router.db_for_read(User))
+
+        request = self.factory.get('/')
+        request.COOKIES['db_pin'] = '1'
+        response = ReplicaPinningMiddleware(view)(request)
+        self.assertEqual(response.content, b'default')
+        self.assertNotIn('db_pin', response.cookies)
+
+    def test_reads_without_cookie_use_replica(self):
+        def view(request):
+            return HttpResponse(self.router.db_for_read(User))
+
+        response = ReplicaPinningMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica_1')
+
+
+PAGE = b'<p>' + b'producto ' * 200 + b'</p>'
+
+
+@override_settings(COMPRESSION_MIN_SIZE=500)
+class CompressionMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def compress(self, response, accept_encoding='gzip, deflate, br', view=None):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(view or (lambda request: response))(request)
+
+    def test_gzip_when_brotli_is_not_offered(self):
+        response = self.compress(HttpResponse(PAGE), 'gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), PAGE)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_when_preferred(self):
+        response = self.compress(HttpResponse(PAGE), 'gzip;q=0.5, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), PAGE)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_pages_with_a_csrf_token_are_only_gzipped(self):
+        def view(request):
+            return HttpResponse(PAGE + get_token(request).encode())
+
+        response = self.compress(None, 'br, gzip', view=view)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_gzip_is_padded_randomly(self):
+        # BREACH: the same body must not always compress to the same length
+        lengths = {len(self.compress(HttpResponse(PAGE), 'gzip').content) for _ in range(20)}
+        self.assertGreater(len(lengths), 1)
+
+    def test_q_zero_refuses_an_encoding(self):
+        response = self.compress(HttpResponse(PAGE), 'gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, PAGE)
+
+    def test_unknown_encodings_are_ignored(self):
+        response = self.compress(HttpResponse(PAGE), 'zstd')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_small_responses_are_left_alone(self):
+        response = self.compress(HttpResponse(b'<p>hola</p>'), 'gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_non_text_types_are_left_alone(self):
+        response = self.compress(HttpResponse(PAGE, content_type='image/png'), 'gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_vary_is_added_to_existing_values(self):
+        response = HttpResponse(PAGE)
+        response['Vary'] = 'Cookie'
+        response = self.compress(response, 'gzip')
+        self.assertEqual(response['Vary'], 'Cookie, Accept-Encoding')
+
+    def test_etag_is_weakened(self):
+        response = HttpResponse(PAGE)
+        response['ETag'] = '"abc"'
+        response = self.compress(response, 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+    def test_streaming_responses_are_flushed_per_chunk(self):
+        chunks = [b'<li>%d</li>' % i for i in range(50)]
+        response = StreamingHttpResponse(iter(chunks))
+        response['Content-Length'] = '999'
+        response = self.compress(response, 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        compressed = list(response.streaming_content)
+        # Header, one flushed block per chunk, trailer
+        self.assertEqual(len(compressed), len(chunks) + 2)
+        self.assertEqual(gzip.decompress(b''.join(compressed)), b''.join(chunks))
+
+
+class LeaderLockTests(SimpleTestCase):
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_only_one_holder_at_a_time(self):
+        with leader_lock('job') as first:
+            with leader_lock('job') as second:
+                self.assertTrue(first)
+                self.assertFalse(second)
+        with leader_lock('job') as again:
+            self.assertTrue(again)
+
+    @override_settings(DB_POOL_MODE='pgbouncer')
+    def test_pgbouncer_uses_the_cache_instead_of_advisory_locks(self):
+        # Session advisory locks don't survive transaction pooling
+        connection = mock.Mock(vendor='postgresql')
+        with mock.patch('core.locks.connection', connection):
+            with leader_lock('job') as first, leader_lock('job') as second:
+                self.assertTrue(first)
+                self.assertFalse(second)
+        connection.cursor.assert_not_called()
+
+
+class FakeConnection:
+    connection = None
+
+    def ensure_connection(self):
+        if self.connection is None:
+            self.connection = object()
+
+
+@override_settings(DB_TIMING_REPORT=True)
+class DBTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_server_timing_counts_the_queries(self):
+        def view(request):
+            list(User.objects.all())
+            list(Category.objects.all())
+            return HttpResponse()
+
+        response = DBTimingMiddleware(view)(self.factory.get('/'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db-connect;dur=[\d.]+;desc="0 connects", db;dur=[\d.]+;desc="2 queries"$',
+        )
+
+    def test_streaming_responses_get_no_header(self):
+        def view(request):
+            return StreamingHttpResponse(str(pk) for pk in User.objects.values_list('pk', flat=True))
+
+        response = DBTimingMiddleware(view)(self.factory.get('/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_only_new_connections_are_counted(self):
+        report = DBTimingReport()
+        connection = FakeConnection()
+        restore = report.track_connect(connection)
+        connection.ensure_connection()
+        connection.ensure_connection()
+        self.assertEqual(report.connects, 1)
+        restore()
+        connection.connection = None
+        connection.ensure_connection()
+        self.assertEqual(report.connects, 1)
+
+    @override_settings(DB_TIMING_REPORT=False)
+    def test_disabled_by_setting(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            DBTimingMiddleware(lambda request: HttpResponse())
+
+
+class CompressedManifestStaticFilesStorageTests(SimpleTestCase):
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(self.root.cleanup)
+        files = {
+            'logo.svg': '<svg>' + ' ' * 300 + '</svg>',
+            'site.css': '.logo { background: url("logo.svg"); }\n' + '.a { color: red; }\n' * 20,
+            'theme.css': '@import url("site.css");\n' + '.b { color: blue; }\n' * 20,
+            'tiny.js': 'let a = 1;',
+        }
+        for name, content in files.items():
+            with open(os.path.join(source.name, name), 'w') as f:
+                f.write(content)
+        self.settings = override_settings(
+            STATICFILES_DIRS=[source.name],
+            STATIC_ROOT=self.root.name,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'core.storage.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def test_only_final_hashed_names_are_compressed(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root.name, 'staticfiles.json')) as f:
+            manifest = json.load(f)['paths']
+        compressed = {name[:-3] for name in os.listdir(self.root.name) if name.endswith('.gz')}
+        self.assertEqual(compressed, {manifest['logo.svg'], manifest['site.css'], manifest['theme.css']})
+        with open(os.path.join(self.root.name, manifest['theme.css']), 'rb') as f:
+            original = f.read()
+        with gzip.open(os.path.join(self.root.name, manifest['theme.css'] + '.gz')) as f:
+            self.assertEqual(f.read(), original)
+
+
+class WarmUpTests(SimpleTestCase):
+    def run_steps(self, *steps):
+        with mock.patch('core.warmup.STEPS', list(steps)), mock.patch('core.warmup.connections'):
+            return warm_up()
+
+    def test_expected_errors_skip_the_step(self):
+        def api_down():
+            raise requests.exceptions.ConnectionError('down')
+
+        with self.assertLogs('core.warmup', 'WARNING') as logs:
+            timings = self.run_steps(
+                ('categories', api_down, requests.exceptions.RequestException),
+                ('urls', lambda: None, ImportError),
+            )
+        self.assertEqual(list(timings), ['categories', 'urls'])
+        self.assertIn('categories failed: down', logs.output[0])
+
+    def test_other_errors_stop_the_boot(self):
+        def broken():
+            raise TypeError('bug')
+
+        with self.assertRaises(TypeError):
+            self.run_steps(('categories', broken, requests.exceptions.RequestException))
+
+
+class QueryShapeTests(SimpleTestCase):
+    def test_literals_are_replaced(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE id = 12 AND name = 'o''hara'"),
+            'SELECT * FROM t WHERE id = ? AND name = ?',
+        )
+
+    def test_in_lists_are_collapsed(self):
+        self.assertEqual(query_shape('WHERE id IN (%s, %s, %s)'), query_shape('WHERE id IN (%s)'))
+
+
+class AssertMaxQueriesTests(TestCase):
+    def test_within_budget(self):
+        with assert_max_queries(1) as recorder:
+            User.objects.count()
+        self.assertEqual(len(recorder), 1)
+
+    def test_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_max_queries(1):
+                User.objects.count()
+                User.objects.exists()
+
+    def test_repeated_shape_is_reported_as_n_plus_one(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'possible N+1, 3 times'):
+            with assert_max_queries(10, repeat_threshold=3):
+                for pk in range(3):
+                    User.objects.filter(pk=pk).exists()
+
+    def test_paused_queries_are_not_counted(self):
+        with assert_max_queries(0):
+            with paused():
+                User.objects.count()
+
+
+@override_settings(QUERY_BUDGET_CHECKS=True, QUERY_BUDGET_STRICT=True, QUERY_BUDGET_REPEAT_THRESHOLD=5)
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def call(self, view):
+        middleware = QueryBudgetMiddleware(view)
+        request = self.factory.get('/')
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_view_within_budget(self):
+        @query_budget(1)
+        def view(request):
+            return HttpResponse(User.objects.count())
+
+        self.assertEqual(self.call(view).status_code, 200)
+
+    def test_view_over_budget(self):
+        @query_budget(1)
+        def view(request):
+            User.objects.count()
+            return HttpResponse(User.objects.count())
+
+        with self.assertRaisesMessage(QueryBudgetExceeded, '2 queries, budget is 1'):
+            self.call(view)
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_not_strict_only_logs(self):
+        @query_budget(0)
+        def view(request):
+            return HttpResponse(User.objects.count())
+
+        with self.assertLogs('core.query_budget', 'WARNING'):
+            self.assertEqual(self.call(view).status_code, 200)
+
+
+class FlamegraphTests(SimpleTestCase):
+    def test_innermost_known_module_wins(self):
+        self.assertEqual(categorize('django.template.base:render;django.db.models.query:__iter__'), 'db')
+        self.assertEqual(categorize('products.views:product_list;requests.sessions:send'), 'upstream')
+        self.assertEqual(categorize('products.views:product_list'), 'python')
+
+    def test_labels_are_escaped(self):
+        svg = render_flamegraph('main:<module>;app:<lambda> 3\nmain:<module> 1')
+        self.assertIn('main:&lt;module&gt;', svg)
+        self.assertNotIn('<lambda>', svg)
+
+    def test_empty_profile(self):
+        self.assertEqual(render_flamegraph(''), '')
+
+
+@override_settings(
+    PROFILING_ENABLED=True, PROFILE_SAMPLE_RATES={}, PROFILE_MAX_PER_MINUTE=2,
+    QUERY_BUDGET_CHECKS=True, QUERY_BUDGET_STRICT=True,
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('jefa', password='secreta-123', is_staff=True)
+        cls.user = User.objects.create_user('ana', password='secreta-123')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_staff_request_is_profiled(self):
+        # The record is saved outside the view's query budget
+        self.client.force_login(self.staff)
+        self.client.get(reverse('accounts:login'), HTTP_X_PROFILE='1')
+        record = ProfileRecord.objects.get()
+        self.assertEqual(record.trigger, ProfileRecord.MANUAL)
+        self.assertEqual(record.view_name, 'accounts:login')
+        self.assertEqual(record.user, self.staff)
+
+    def test_other_users_cannot_ask_for_a_profile(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('accounts:login'), {'__profile': '1'})
+        self.assertFalse(ProfileRecord.objects.exists())
+
+    @override_settings(PROFILE_SAMPLE_RATES={'accounts:login': 1.0})
+    def test_sampled_views_are_rate_limited(self):
+        for _ in range(3):
+            self.client.get(reverse('accounts:login'))
+        self.assertEqual(ProfileRecord.objects.filter(trigger=ProfileRecord.SAMPLED).count(), 2)
+
+
+@override_settings(
+    PRERENDER_ENABLED=True, PRODUCT_PREFETCH_POPULAR=False, PRODUCT_OUTBOX_AUTOSTART=False,
+    CATALOG_SNAPSHOT_CHECK_INTERVAL=0, QUERY_BUDGET_CHECKS=False,
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+class PrerenderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(id=1, name='Ropa')
+        Product.objects.create(id=1, title='Camiseta', price=25, description='Algodón', category=cls.category)
+        cls.user = User.objects.create_user('ana', password='secreta-123')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        bump_version()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.settings_override = override_settings(PRERENDER_ROOT=self.root.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.manifest = prerender_pages(pages=['/', '/accounts/login/'], product_lists=['/products/'])
+
+    def test_anonymous_visitors_get_the_prerendered_page(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'W/"{self.manifest["/"]["file"]}"')
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_forms_get_a_fresh_csrf_token(self):
+        self.assertTrue(self.manifest['/accounts/login/']['csrf'])
+        response = self.client.get('/accounts/login/')
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_authenticated_users_get_the_dynamic_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'Hola, ana')
+
+    def test_product_list_is_only_served_for_the_same_catalog(self):
+        self.assertTrue(self.client.get('/products/').has_header('ETag'))
+
+        Product.objects.create(id=2, title='Pantalón', price=40, description='Mezclilla', category=self.category)
+        bump_version()
+        response = self.client.get('/products/')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('Pantalón', b''.join(response.streaming_content).decode())
+
+
+@override_settings(
+    SERVER_WORKERS=0, SERVER_THREADS=0, SERVER_MAX_THREADS=32,
+    SERVER_REQUEST_CPU_MS=10, SERVER_UPSTREAM_LATENCY_MS=200, SERVER_MAX_REQUESTS=1000,
+    SERVER_UPSTREAM_WAIT_SHARE=1.0, SERVER_SIZING_MIN_PROFILES=3,
+)
+class ServerConfigTests(SimpleTestCase):
+    def test_threads_cover_the_api_latency(self):
+        config = server_config(cpus=4, upstream_latency=0.05)
+        self.assertEqual((config['workers'], config['threads']), (4, 6))
+        self.assertEqual(config['max_requests_jitter'], 100)
+
+    def test_limits(self):
+        self.assertEqual(server_config(cpus=1, upstream_latency=0)['workers'], 2)
+        self.assertEqual(server_config(cpus=1, upstream_latency=0)['threads'], 1)
+        self.assertEqual(server_config(cpus=1, upstream_latency=5)['threads'], 32)
+        # Without a measurement SERVER_UPSTREAM_LATENCY_MS is used
+        self.assertEqual(server_config(cpus=1)['threads'], 21)
+
+    @override_settings(SERVER_UPSTREAM_WAIT_SHARE=0.2, SERVER_MAX_THREADS=8)
+    def test_only_a_share_of_requests_waits_for_the_api(self):
+        self.assertEqual(server_config(cpus=1, upstream_latency=0.1)['threads'], 3)
+        self.assertEqual(server_config(cpus=1, upstream_latency=5)['threads'], 8)
+
+    def test_sized_from_profiles(self):
+        # 30 ms waiting per 10 ms of CPU, whatever the API latency
+        config = server_config(cpus=2, upstream_latency=1, request_costs=(0.01, 0.03))
+        self.assertEqual((config['threads'], config['sized_from']), (4, 'profiles'))
+
+    @override_settings(SERVER_WORKERS=3, SERVER_THREADS=8)
+    def test_settings_override(self):
+        config = server_config(cpus=16, upstream_latency=1)
+        self.assertEqual((config['workers'], config['threads']), (3, 8))
+
+
+@override_settings(SERVER_SIZING_MIN_PROFILES=3)
+class ProfiledRequestCostsTests(TestCase):
+    def profile(self, trigger, duration_ms, upstream_ms, db_ms):
+        ProfileRecord.objects.create(
+            method='GET', path='/', trigger=trigger, status_code=200, duration_ms=duration_ms, samples=1,
+            interval_ms=5, db_queries=1, db_ms=db_ms, upstream_ms=upstream_ms, template_ms=0,
+        )
+
+    def test_averages_the_sampled_profiles(self):
+        self.profile(ProfileRecord.SAMPLED, 12, 0, 2)
+        self.profile(ProfileRecord.SAMPLED, 10, 0, 0)
+        self.assertIsNone(profiled_request_costs())
+
+        self.profile(ProfileRecord.SAMPLED, 128, 100, 2)
+        # Requested profiles are usually slow pages someone is looking into
+        self.profile(ProfileRecord.MANUAL, 5000, 4000, 0)
+        cpu, wait = profiled_request_costs()
+        self.assertAlmostEqual(cpu, 0.0153333, places=5)
+        self.assertAlmostEqual(wait, 0.0346666, places=5)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.client_ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'[]')
+
+    def log_message(self, *args):
+        pass
+
+
+class PreloadForkTests(SimpleTestCase):
+    def setUp(self):
+        self.api = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.api.client_ports = []
+        threading.Thread(target=self.api.serve_forever, args=(0.01,), daemon=True).start()
+        self.addCleanup(self.api.server_close)
+        self.addCleanup(self.api.shutdown)
+        self.addCleanup(gc.unfreeze)
+        self.url = f'http://127.0.0.1:{self.api.server_address[1]}/categories'
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_workers_do_not_share_the_masters_api_connections(self):
+        from products import upstream
+
+        # The master talks to the API while preloading (warm-up, latency probe)
+        upstream.session.get(self.url, timeout=5)
+        when_ready(None)
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                ok = upstream.session.get(self.url, timeout=5).status_code == 200
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        upstream.session.get(self.url, timeout=5)
+
+        # Master, worker, master: a fresh connection each time
+        self.assertEqual(len(set(self.api.client_ports)), 3)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'},
+        'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_local_caches_are_reported(self):
+        warnings = check_shared_caches(None)
+        self.assertEqual([w.msg for w in warnings], ["The 'throttle' cache is local to each process."])
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'},
+            'throttle': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'},
+            'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        },
+        SESSION_CACHE_ALIAS='sessions',
+    )
+    def test_local_session_cache_is_reported_when_used(self):
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            self.assertEqual(check_shared_caches(None), [])
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
+            warnings = check_shared_caches(None)
+        self.assertEqual([w.msg for w in warnings], ["The 'sessions' cache is local to each process."])
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+class PurgeSessionsTests(TestCase):
+    def test_only_expired_sessions_are_deleted(self):
+        now = timezone.now()
+        for i in range(3):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIn('3 expired sessions deleted', out.getvalue())
+
+
+class SessionStrategySettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        environ = {k: v for k, v in os.environ.items() if not k.startswith(('DJANGO_SESSION', 'SESSION_'))} | environ
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return runpy.run_path(settings_module.__file__)
+
+    def test_default_keeps_sessions_in_the_database(self):
+        self.assertEqual(self.load_settings()['SESSION_ENGINE'], 'django.contrib.sessions.backends.db')
+        self.assertEqual(
+            self.load_settings(SESSION_REDIS_URL='redis://cache')['SESSION_ENGINE'],
+            'django.contrib.sessions.backends.cached_db',
+        )
+
+    def test_cache_strategy_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'SESSION_REDIS_URL'):
+            self.load_settings(DJANGO_SESSION_STRATEGY='cache')
+        loaded = self.load_settings(DJANGO_SESSION_STRATEGY='cache', SESSION_REDIS_URL='redis://cache')
+        self.assertEqual(loaded['SESSION_ENGINE'], 'django.contrib.sessions.backends.cache')
+        self.assertEqual(loaded['CACHES']['sessions']['LOCATION'], 'redis://cache')
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings(DJANGO_SESSION_STRATEGY='files')
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(settings_module.__file__)
+
+    def test_pool_mode_needs_psycopg_pool(self):
+        with mock.patch.dict(sys.modules, {'psycopg_pool': None}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'psycopg[pool]'):
+                self.load_settings(DB_ENGINE='postgresql', DB_POOL_MODE='pool')
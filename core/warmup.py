@@ -0,0 +1,79 @@
+"""
+Worker warm-up: does the work a cold worker would otherwise do on its
+first requests (importing every view, compiling templates, loading the
+catalog snapshot and the category list) before it starts taking traffic.
+"""
+import logging
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def load_urls():
+    # Populating the resolver imports every view module
+    return len(get_resolver().url_patterns)
+
+
+def compile_templates():
+    """Load the project templates into the cached template loader."""
+    engine = engines['django']
+    count = 0
+    for directory in engine.dirs:
+        for path in sorted(Path(directory).rglob('*.html')):
+            engine.get_template(path.relative_to(directory).as_posix())
+            count += 1
+    return count
+
+
+def load_snapshot():
+    from products.snapshot import get_snapshot
+    return len(get_snapshot())
+
+
+def load_categories():
+    from products.upstream import get_categories
+    return len(get_categories())
+
+
+# (name, step, errors it may raise without the worker being broken)
+STEPS = [
+    ('urls', load_urls, ImportError),
+    ('templates', compile_templates, TemplateSyntaxError),
+    ('snapshot', load_snapshot, DatabaseError),
+    ('categories', load_categories, requests.exceptions.RequestException),
+]
+
+
+def warm_up():
+    """
+    Run every warm-up step and return {step: seconds}. A step failing with
+    one of its expected errors (the API or the database being down, say) is
+    logged and skipped: a worker that couldn't warm up still has to boot.
+    Anything else is a bug and stops the boot.
+    """
+    timings = {}
+    for name, step, errors in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except errors as e:
+            logger.warning('Worker warm-up step %s failed: %s', name, e)
+        timings[name] = time.perf_counter() - started
+
+    # With a preloading server this runs before forking; a connection
+    # opened here must not be shared by the workers
+    connections.close_all()
+    return timings
+
+
+def warm_up_if_enabled():
+    if settings.WORKER_WARMUP:
+        timings = warm_up()
+        logger.info('Worker warm-up: %s', ', '.join(f'{k} {v * 1000:.0f}ms' for k, v in timings.items()))
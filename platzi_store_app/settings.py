@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-kgolxug^hdj0$-32hxmjmkzi129dte-&y110hy$-9(#z4tg6ae'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = ['*']
 
@@ -57,15 +60,105 @@ REST_FRAMEWORK = {
     ],
     
     # Configuración de throttling (límite de peticiones)
+    # Contadores de ventana fija en la caché compartida (ver THROTTLE_CACHE_ALIAS)
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'accounts.throttling.AnonCounterRateThrottle',
+        'accounts.throttling.UserCounterRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',  # Para usuarios anónimos
-        'user': '1000/hour'   # Para usuarios autenticados
+        'user': '1000/hour',  # Para usuarios autenticados
+        'login': '10/min',  # Intentos de login por IP
+        'register': '5/hour',  # Registros por IP
+        'check_username': '60/min'  # Consultas de disponibilidad de usuario
+    }
+}
+
+# Configuración de caché
+# 'default' guarda la caché de productos de la API, la versión del catálogo,
+# los bloqueos de peticiones agrupadas (UPSTREAM_COALESCE_SHARED) y el líder de
+# sync_catalog cuando la BD no es PostgreSQL o se usa PgBouncer. 'throttle'
+# guarda los contadores de límite de peticiones. Con varios workers o nodos
+# ambos deben ser un backend
+# compartido (CACHE_REDIS_URL y THROTTLE_REDIS_URL); con LocMemCache cada proceso
+# tiene el suyo (python manage.py check --deploy lo avisa).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_REDIS_URL'],
+        'KEY_PREFIX': 'platzi_store',
+    }
+
+if os.environ.get('THROTTLE_REDIS_URL'):
+    CACHES['throttle'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['THROTTLE_REDIS_URL'],
+        'KEY_PREFIX': 'platzi_store',
     }
+
+THROTTLE_CACHE_ALIAS = 'throttle'
+
+# Configuración de sesiones
+# Estrategias disponibles:
+# - 'db': solo django_session (comportamiento por defecto de Django)
+# - 'cached_db': caché con respaldo en django_session
+# - 'cache': la sesión vive solo en el alias de caché 'sessions'; exige
+#   SESSION_REDIS_URL, porque con una caché por proceso cada worker tendría
+#   sus propias sesiones y un reinicio cerraría todas
+# - 'signed_cookies': la sesión viaja firmada en la cookie, sin tocar la BD;
+#   no se puede revocar en el servidor y depende de SECRET_KEY
+# Por defecto 'cached_db' si hay SESSION_REDIS_URL y 'db' si no, de modo que
+# las sesiones existentes siguen siendo válidas
+SESSION_STRATEGY = os.environ.get(
+    'DJANGO_SESSION_STRATEGY', 'cached_db' if os.environ.get('SESSION_REDIS_URL') else 'db'
+)
+SESSION_ENGINES = {
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
 }
+if SESSION_STRATEGY not in SESSION_ENGINES:
+    raise ImproperlyConfigured(
+        f'Unknown DJANGO_SESSION_STRATEGY "{SESSION_STRATEGY}". Use one of: {", ".join(SESSION_ENGINES)}'
+    )
+if SESSION_STRATEGY == 'cache' and not os.environ.get('SESSION_REDIS_URL'):
+    raise ImproperlyConfigured(
+        'DJANGO_SESSION_STRATEGY "cache" needs SESSION_REDIS_URL: a per-process cache '
+        'loses the sessions on restart and doesn\'t share them between workers.'
+    )
+SESSION_ENGINE = SESSION_ENGINES[SESSION_STRATEGY]
+
+CACHES['sessions'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'sessions',
+}
+
+if os.environ.get('SESSION_REDIS_URL'):
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['SESSION_REDIS_URL'],
+        'KEY_PREFIX': 'platzi_store',
+    }
+
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Los mensajes flash viajan en una cookie en lugar de la sesión
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Si es False, login_api solo devuelve el token y no crea una sesión de Django,
+# salvo que el cliente la pida explícitamente con "session": true
+API_LOGIN_CREATES_SESSION = os.environ.get('API_LOGIN_CREATES_SESSION', 'False') == 'True'
 
 # Configuración de CORS (Cross-Origin Resource Sharing)
 # Importante para permitir peticiones desde frontend en diferentes dominios
@@ -112,12 +205,18 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
+    'core.middleware.DBTimingMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.prerender.PrerenderedPageMiddleware',
 ]
 
 ROOT_URLCONF = 'platzi_store_app.urls'
@@ -126,8 +225,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Las plantillas se compilan una sola vez por proceso
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -143,16 +248,104 @@ WSGI_APPLICATION = 'platzi_store_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'masteruser',
-        'PASSWORD': 'masterpassword',
-        'HOST': 'db-adso-store.cl68g6muk7q2.us-east-2.rds.amazonaws.com',
-        'PORT': '5432'
+# Modos de conexión a Postgres (DB_POOL_MODE):
+# - 'persistent': reutiliza la conexión de cada worker durante DB_CONN_MAX_AGE
+#   segundos y la verifica antes de usarla (CONN_HEALTH_CHECKS)
+# - 'pool': pool de conexiones de psycopg 3 (requiere psycopg[pool])
+# - 'pgbouncer': conecta a un PgBouncer local en modo transacción
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'persistent')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'postgres'),
+            'USER': os.environ.get('DB_USER', 'masteruser'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', 'masterpassword'),
+            'HOST': os.environ.get('DB_HOST', 'db-adso-store.cl68g6muk7q2.us-east-2.rds.amazonaws.com'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+
+    if DB_POOL_MODE == 'pool':
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured(
+                'DB_POOL_MODE "pool" needs psycopg 3 and its pool: pip install "psycopg[pool]" '
+                '(requirements.txt only installs psycopg2).'
+            )
+        # El pool gestiona la vida de las conexiones; Django exige CONN_MAX_AGE = 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }
+    elif DB_POOL_MODE == 'pgbouncer':
+        DATABASES['default']['HOST'] = os.environ.get('DB_HOST', '127.0.0.1')
+        DATABASES['default']['PORT'] = os.environ.get('DB_PORT', '6432')
+        # En modo transacción los cursores del lado del servidor y los
+        # advisory locks de sesión no sobreviven entre transacciones; el
+        # líder de sync_catalog usa la caché compartida (core/locks.py)
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Réplicas de lectura (DB_REPLICAS, separadas por comas): hosts de Postgres o,
+# con DB_ENGINE=sqlite, rutas de archivos. Se registran como 'replica_1', ...
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(DATABASES['default'])
+    DATABASES[alias]['HOST' if DB_ENGINE != 'sqlite' else 'NAME'] = replica.strip()
+    # Los tests usan la misma BD que 'default' en lugar de crear otra
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# Segundos durante los que un cliente lee del primario tras una escritura,
+# para que vea sus propios cambios aunque las réplicas vayan con retraso
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
+# Añade la cabecera Server-Timing con el tiempo de conexión y consultas a la BD
+DB_TIMING_REPORT = os.environ.get('DB_TIMING_REPORT', str(DEBUG)) == 'True'
+
+# Perfilado bajo demanda (core/profiling.py): el staff lo pide con la cabecera
+# X-Profile: 1 o ?__profile=1, y PROFILE_SAMPLE_RATES perfila una fracción de
+# las peticiones a ciertas vistas, p. ej.
+# "product_list=0.01,accounts:api_login=0.05". Como mucho
+# PROFILE_MAX_PER_MINUTE perfiles por minuto; resultados en el admin
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'True') == 'True'
+PROFILE_SAMPLE_RATES = {
+    view_name: float(rate)
+    for view_name, _, rate in (
+        item.partition('=') for item in os.environ.get('PROFILE_SAMPLE_RATES', '').split(',') if item
+    )
 }
+PROFILE_INTERVAL_MS = int(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_MAX_PER_MINUTE = int(os.environ.get('PROFILE_MAX_PER_MINUTE', '6'))
+
+# Presupuesto de consultas por vista (@query_budget en core/query_budget.py).
+# Con QUERY_BUDGET_CHECKS se registran las consultas de cada petición y se
+# avisa en el log si una vista supera su presupuesto o si la misma consulta se
+# repite QUERY_BUDGET_REPEAT_THRESHOLD veces (posible N+1). Con
+# QUERY_BUDGET_STRICT se lanza una excepción en vez de avisar (tests)
+QUERY_BUDGET_CHECKS = os.environ.get('QUERY_BUDGET_CHECKS', str(DEBUG)) == 'True'
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'False') == 'True'
+QUERY_BUDGET_REPEAT_THRESHOLD = 5
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -190,6 +383,136 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATICFILES_DIRS = [BASE_DIR / 'static']
+
+# Destino de collectstatic; el servidor web sirve esta carpeta con caché inmutable
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Los archivos estáticos se publican con el hash del contenido en el nombre
+# y versiones precomprimidas (.gz/.br) generadas por collectstatic
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'core.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Compresión de respuestas: gzip con la mitigación de BREACH de Django, y
+# brotli si el paquete opcional está instalado (pip install brotli) para las
+# páginas sin token CSRF
+# Las respuestas más pequeñas que este tamaño se envían sin comprimir
+COMPRESSION_MIN_SIZE = 500
+
+# La lista de productos envía la cabecera de la página antes de consultar la
+# API y luego las tarjetas por bloques (StreamingHttpResponse)
+PRODUCT_LIST_STREAMING = os.environ.get('PRODUCT_LIST_STREAMING', 'True') == 'True'
+
+# Cola de escritura diferida (outbox) para crear, editar y eliminar productos:
+# las vistas responden de inmediato y los cambios se envían a la API en segundo
+# plano con reintentos (python manage.py process_outbox)
+PRODUCTS_WRITE_BEHIND = os.environ.get('PRODUCTS_WRITE_BEHIND', 'True') == 'True'
+# Procesa la cola en un hilo del propio worker web, que sigue vivo mientras
+# queden cambios pendientes y espera a que toque reintentar los fallidos
+# (como mucho PRODUCT_OUTBOX_POLL_INTERVAL segundos si hay cambios en curso en
+# otro proceso); desactivar si se ejecuta process_outbox como proceso aparte
+PRODUCT_OUTBOX_AUTOSTART = os.environ.get('PRODUCT_OUTBOX_AUTOSTART', 'True') == 'True'
+PRODUCT_OUTBOX_WORKERS = int(os.environ.get('PRODUCT_OUTBOX_WORKERS', '4'))
+PRODUCT_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('PRODUCT_OUTBOX_MAX_ATTEMPTS', '8'))
+PRODUCT_OUTBOX_POLL_INTERVAL = float(os.environ.get('PRODUCT_OUTBOX_POLL_INTERVAL', '2'))
+
+# Caché de productos de la API (detalle y edición)
+# Durante PRODUCT_CACHE_FRESH_SECONDS se usa sin consultar la API; después se
+# revalida con If-None-Match/If-Modified-Since. La copia se guarda en la
+# caché compartida hasta PRODUCT_CACHE_MAX_AGE y en memoria del worker
+# (LRU de PRODUCT_CACHE_LOCAL_SIZE entradas) durante PRODUCT_CACHE_LOCAL_TTL
+PRODUCT_CACHE_FRESH_SECONDS = int(os.environ.get('PRODUCT_CACHE_FRESH_SECONDS', '60'))
+PRODUCT_CACHE_MAX_AGE = int(os.environ.get('PRODUCT_CACHE_MAX_AGE', '86400'))
+PRODUCT_CACHE_LOCAL_SIZE = 256
+PRODUCT_CACHE_LOCAL_TTL = 5
+
+# Los primeros PRODUCT_DETAIL_SEED_LIMIT productos de la lista se guardan en la
+# caché de detalle, así al hacer clic no se consulta la API (0 lo desactiva).
+# Con PRODUCT_PREFETCH_POPULAR cada worker cuenta los clics desde la lista y un
+# hilo en segundo plano refresca cada PRODUCT_PREFETCH_INTERVAL segundos los
+# PRODUCT_PREFETCH_TOP productos más visitados con PRODUCT_PREFETCH_WORKERS hilos
+PRODUCT_DETAIL_SEED_LIMIT = 48
+PRODUCT_PREFETCH_POPULAR = os.environ.get('PRODUCT_PREFETCH_POPULAR', 'True') == 'True'
+PRODUCT_PREFETCH_TOP = 20
+PRODUCT_PREFETCH_INTERVAL = 30
+PRODUCT_PREFETCH_WORKERS = 2
+
+# Peticiones idénticas simultáneas a la API (misma búsqueda o mismo producto)
+# comparten una sola petición dentro del proceso. Con UPSTREAM_COALESCE_SHARED
+# también entre procesos, mediante un candado en la caché compartida; el
+# resultado se publica durante UPSTREAM_COALESCE_RESULT_TTL segundos, solo
+# para quienes esperaban a esa petición (las llamadas posteriores piden de
+# nuevo). Quien espera se rinde tras UPSTREAM_COALESCE_TIMEOUT segundos
+UPSTREAM_COALESCE_SHARED = os.environ.get('UPSTREAM_COALESCE_SHARED', 'False') == 'True'
+UPSTREAM_COALESCE_TIMEOUT = 30
+UPSTREAM_COALESCE_RESULT_TTL = 2
+
+# Origen de la lista de productos: 'snapshot' filtra en memoria la copia local
+# del catálogo (sync_catalog) y usa la API solo si aún está vacía; 'upstream'
+# consulta siempre la API
+PRODUCT_LIST_SOURCE = os.environ.get('PRODUCT_LIST_SOURCE', 'snapshot')
+# Cada cuántos segundos un worker comprueba si el catálogo cambió, y edad
+# máxima de su copia en memoria aunque no reciba avisos
+CATALOG_SNAPSHOT_CHECK_INTERVAL = 1
+CATALOG_SNAPSHOT_MAX_AGE = 300
+
+# Modo de acceso a la API: 'live' (normal), 'record' (usa la API y guarda las
+# respuestas en UPSTREAM_SNAPSHOT_PATH al terminar el proceso) o 'replay'
+# (responde desde ese archivo sin red, con UPSTREAM_REPLAY_LATENCY_MS de
+# retardo más hasta UPSTREAM_REPLAY_JITTER_MS aleatorios).
+# Para grabar el catálogo completo: python manage.py record_upstream
+UPSTREAM_MODE = os.environ.get('UPSTREAM_MODE', 'live')
+UPSTREAM_SNAPSHOT_PATH = os.environ.get('UPSTREAM_SNAPSHOT_PATH', str(BASE_DIR / 'upstream_snapshot.bin'))
+UPSTREAM_REPLAY_LATENCY_MS = int(os.environ.get('UPSTREAM_REPLAY_LATENCY_MS', '0'))
+UPSTREAM_REPLAY_JITTER_MS = int(os.environ.get('UPSTREAM_REPLAY_JITTER_MS', '0'))
+
+# Al arrancar cada worker (wsgi.py) importa las vistas, compila las plantillas
+# y carga el catálogo y las categorías antes de recibir tráfico.
+# python manage.py profile_startup muestra cuánto cuesta cada fase
+WORKER_WARMUP = os.environ.get('WORKER_WARMUP', str(not DEBUG)) == 'True'
+
+# Servidor de producción: python manage.py runprod (gunicorn, core/server.py).
+# La app se precarga en el proceso maestro y los workers la comparten. Por
+# defecto un worker por CPU (mínimo 2) y 1 + espera media por petición / CPU
+# por petición hilos por worker, hasta SERVER_MAX_THREADS. Ambos valores salen
+# de los últimos perfiles muestreados (al menos SERVER_SIZING_MIN_PROFILES);
+# sin ellos la CPU es SERVER_REQUEST_CPU_MS y la espera la latencia de la API
+# medida al arrancar (SERVER_UPSTREAM_LATENCY_MS si no responde) por
+# SERVER_UPSTREAM_WAIT_SHARE, la fracción de peticiones que llegan a la API
+# (el resto sale del catálogo local y de las cachés).
+# SERVER_WORKERS y SERVER_THREADS fijan los valores a mano (0 = automático).
+# Cada worker se recicla tras SERVER_MAX_REQUESTS peticiones; un worker nuevo
+# empieza con las cachés en memoria vacías, así que no conviene hacerlo a menudo.
+# python manage.py bench_server compara esta configuración con la por defecto
+SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', '0'))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '0'))
+SERVER_MAX_THREADS = int(os.environ.get('SERVER_MAX_THREADS', '8'))
+SERVER_REQUEST_CPU_MS = float(os.environ.get('SERVER_REQUEST_CPU_MS', '10'))
+SERVER_UPSTREAM_LATENCY_MS = float(os.environ.get('SERVER_UPSTREAM_LATENCY_MS', '200'))
+SERVER_UPSTREAM_WAIT_SHARE = float(os.environ.get('SERVER_UPSTREAM_WAIT_SHARE', '0.2'))
+SERVER_SIZING_MIN_PROFILES = int(os.environ.get('SERVER_SIZING_MIN_PROFILES', '50'))
+SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', '20000'))
+SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', '30'))
+
+# Páginas pre-renderizadas para visitantes anónimos (core/prerender.py).
+# python manage.py prerender_pages las genera en PRERENDER_ROOT al desplegar
+# (después de collectstatic) y se regeneran tras cada sincronización del
+# catálogo. PRERENDER_PRODUCT_LISTS son las URL de la lista de productos más
+# visitadas, separadas por comas, p. ej. "/products/,/products/?category=1"
+PRERENDER_ENABLED = os.environ.get('PRERENDER_ENABLED', str(not DEBUG)) == 'True'
+PRERENDER_ROOT = Path(os.environ.get('PRERENDER_ROOT', BASE_DIR / 'prerendered'))
+PRERENDER_PAGES = ['/', '/accounts/login/', '/accounts/register/']
+PRERENDER_PRODUCT_LISTS = [
+    url for url in os.environ.get('PRERENDER_PRODUCT_LISTS', '/products/').split(',') if url
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
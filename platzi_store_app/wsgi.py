@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'platzi_store_app.settings')
 
 application = get_wsgi_application()
+
+# Prime caches before the worker takes its first request (WORKER_WARMUP).
+# Under runprod this runs once in the gunicorn master, before forking
+from core.warmup import warm_up_if_enabled  # noqa: E402
+
+warm_up_if_enabled()
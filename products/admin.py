@@ -1,3 +1,23 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Category, Product, ProductMutation
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'price', 'category')
+    list_filter = ('category',)
+    search_fields = ('title',)
+
+
+@admin.register(ProductMutation)
+class ProductMutationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action', 'product_id', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status', 'action')
+    readonly_fields = ('idempotency_key', 'created_at', 'updated_at')
@@ -0,0 +1,132 @@
+"""
+Price statistics over the catalog snapshot.
+
+Everything is computed in one pass over the snapshot's columnar price and
+category arrays, with NumPy when it is installed and plain Python
+otherwise. Results are cached under the snapshot's content digest, so they
+are recomputed only after the catalog changes and shared by every worker
+that has the same catalog.
+
+NumPy is by far the heaviest import in the project and only this module
+uses it, so it is imported on first use rather than at worker boot.
+"""
+import functools
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .snapshot import get_snapshot
+
+PERCENTILES = (25, 50, 75, 90)
+DEFAULT_BINS = 10
+
+
+@functools.cache
+def load_numpy():
+    """The numpy module, or None if it isn't installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile, matching numpy.percentile's default."""
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def histogram(values, edges):
+    counts = [0] * (len(edges) - 1)
+    last = len(counts) - 1
+    low, high = edges[0], edges[-1]
+    width = (high - low) / len(counts) if high > low else 1
+    for value in values:
+        counts[min(int((value - low) / width), last)] += 1
+    return counts
+
+
+def summarize_python(prices, edges):
+    values = sorted(prices)
+    return {
+        'count': len(values),
+        'min': values[0],
+        'max': values[-1],
+        'mean': sum(values) / len(values),
+        'percentiles': {f'p{q}': percentile(values, q) for q in PERCENTILES},
+        'histogram': histogram(values, edges),
+    }
+
+
+def summarize_numpy(np, prices, edges):
+    return {
+        'count': int(prices.size),
+        'min': float(prices.min()),
+        'max': float(prices.max()),
+        'mean': float(prices.mean()),
+        'percentiles': {
+            f'p{q}': float(v) for q, v in zip(PERCENTILES, np.percentile(prices, PERCENTILES))
+        },
+        'histogram': np.histogram(prices, bins=edges)[0].tolist(),
+    }
+
+
+def compute_price_stats(snapshot, bins=DEFAULT_BINS):
+    """
+    Price statistics for the whole catalog and for each category. All
+    histograms share the same bin edges so categories can be compared.
+    """
+    if not len(snapshot):
+        return {'bin_edges': [], 'overall': None, 'categories': []}
+
+    names = {c.id: c.name for c in snapshot.categories}
+
+    np = load_numpy()
+    if np is not None:
+        prices = np.frombuffer(snapshot.prices, dtype=np.float64)
+        category_ids = np.frombuffer(snapshot.category_ids, dtype=np.int64)
+        edges = np.linspace(prices.min(), prices.max(), bins + 1)
+        overall = summarize_numpy(np, prices, edges)
+        # One stable sort groups the prices of each category together
+        order = np.argsort(category_ids, kind='stable')
+        grouped_ids = category_ids[order]
+        grouped_prices = prices[order]
+        unique_ids, starts = np.unique(grouped_ids, return_index=True)
+        groups = zip(unique_ids.tolist(), np.split(grouped_prices, starts[1:]))
+        per_category = [(category_id, summarize_numpy(np, group, edges)) for category_id, group in groups]
+        edges = edges.tolist()
+    else:
+        prices = snapshot.prices
+        low, high = min(prices), max(prices)
+        edges = [low + (high - low) * i / bins for i in range(bins + 1)]
+        overall = summarize_python(prices, edges)
+        grouped = {}
+        for category_id, price in zip(snapshot.category_ids, prices):
+            grouped.setdefault(category_id, []).append(price)
+        per_category = [(category_id, summarize_python(group, edges)) for category_id, group in sorted(grouped.items())]
+
+    return {
+        'bin_edges': edges,
+        'overall': overall,
+        'categories': [
+            {'id': category_id, 'name': names.get(category_id, ''), **stats}
+            for category_id, stats in per_category
+        ],
+    }
+
+
+def get_price_stats(bins=DEFAULT_BINS):
+    """Cached price statistics for the current catalog snapshot."""
+    snapshot = get_snapshot()
+    key = f'catalog_price_stats_{snapshot.digest()}_{bins}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_price_stats(snapshot, bins)
+        # Never stale (the key changes with the contents); the timeout only
+        # lets entries for old catalogs expire
+        cache.set(key, stats, settings.CATALOG_SNAPSHOT_MAX_AGE)
+    return stats
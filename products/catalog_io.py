@@ -0,0 +1,308 @@
+"""
+Bulk export and import of the local catalog.
+
+Supported formats:
+
+- ``csv``: one product per row with a header line.
+- ``jsonl``: one JSON object per line.
+- ``pcat``: a compact columnar binary format. After the ``PCAT1\\n`` magic
+  the file is a sequence of row groups, each a 4-byte little-endian header
+  length, a JSON header describing the columns, and one zlib-compressed
+  block per column (int64 arrays for ids and prices in cents, offset
+  arrays plus UTF-8 data for text). A group with zero rows ends the file.
+
+Exports read the database with ``iterator(chunk_size=...)`` and yield
+encoded chunks, so memory use doesn't grow with the catalog. Imports
+validate every row with the ProductForm rules and insert in batches.
+"""
+import csv
+import io
+import itertools
+import json
+import struct
+import zlib
+from array import array
+from decimal import Decimal
+
+from django.db import transaction
+
+from .forms import ProductForm
+from .models import Category, Product
+from .signals import catalog_synced
+
+FORMATS = ('csv', 'jsonl', 'pcat')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'pcat': 'application/octet-stream',
+}
+COLUMNS = ('id', 'title', 'price', 'description', 'image', 'category_id', 'category_name')
+INT_COLUMNS = ('id', 'category_id')
+PCAT_MAGIC = b'PCAT1\n'
+CHUNK_SIZE = 2000
+
+
+class CatalogFormatError(ValueError):
+    """The input file is not valid for the requested format."""
+
+
+def iter_rows(chunk_size=CHUNK_SIZE):
+    """Catalog rows as tuples in COLUMNS order, streamed from the database."""
+    queryset = Product.objects.order_by('id').values_list(
+        'id', 'title', 'price', 'description', 'image', 'category_id', 'category__name'
+    )
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_csv(rows, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for chunk in chunked(rows, chunk_size):
+        for row in chunk:
+            writer.writerow(['' if value is None else value for value in row])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Only the header was written: the catalog is empty
+        yield buffer.getvalue().encode()
+
+
+def export_jsonl(rows, chunk_size=CHUNK_SIZE):
+    for chunk in chunked(rows, chunk_size):
+        lines = []
+        for row in chunk:
+            record = dict(zip(COLUMNS, row))
+            record['price'] = str(record['price'])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def encode_text_column(values):
+    data = bytearray()
+    offsets = array('q', [0])
+    for value in values:
+        data += (value or '').encode()
+        offsets.append(len(data))
+    return offsets.tobytes() + bytes(data)
+
+
+def pcat_group(chunk):
+    columns = list(zip(*chunk)) if chunk else [()] * len(COLUMNS)
+    blocks = []
+    for name, values in zip(COLUMNS, columns):
+        if name in INT_COLUMNS:
+            raw = array('q', values).tobytes()
+        elif name == 'price':
+            raw = array('q', (int(Decimal(v) * 100) for v in values)).tobytes()
+        else:
+            raw = encode_text_column(values)
+        blocks.append(zlib.compress(raw))
+
+    header = json.dumps({
+        'rows': len(chunk),
+        'columns': [{'name': name, 'length': len(block)} for name, block in zip(COLUMNS, blocks)],
+    }).encode()
+    return struct.pack('<I', len(header)) + header + b''.join(blocks)
+
+
+def export_pcat(rows, chunk_size=CHUNK_SIZE):
+    yield PCAT_MAGIC
+    for chunk in chunked(rows, chunk_size):
+        yield pcat_group(chunk)
+    yield pcat_group([])
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'jsonl': export_jsonl,
+    'pcat': export_pcat,
+}
+
+
+def export_catalog(fmt, chunk_size=CHUNK_SIZE):
+    """Yield the encoded catalog in format `fmt`, one chunk at a time."""
+    return EXPORTERS[fmt](iter_rows(chunk_size), chunk_size)
+
+
+def read_csv(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    try:
+        yield from reader
+    except UnicodeDecodeError:
+        raise CatalogFormatError('The file is not valid UTF-8')
+    except csv.Error as e:
+        raise CatalogFormatError(f'Line {reader.line_num}: {e}')
+
+
+def read_jsonl(stream):
+    try:
+        for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CatalogFormatError(f'Line {line_number} is not valid JSON')
+            if not isinstance(record, dict):
+                raise CatalogFormatError(f'Line {line_number} is not a JSON object')
+            yield record
+    except UnicodeDecodeError:
+        raise CatalogFormatError('The file is not valid UTF-8')
+
+
+def read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise CatalogFormatError('Unexpected end of file')
+    return data
+
+
+def decode_text_column(raw, rows):
+    offsets = array('q')
+    offsets.frombytes(raw[:8 * (rows + 1)])
+    data = raw[8 * (rows + 1):]
+    return [data[offsets[i]:offsets[i + 1]].decode() for i in range(rows)]
+
+
+def read_pcat_group(stream):
+    """The columns of the next row group ({name: values}), or None at the end."""
+    header_length, = struct.unpack('<I', read_exact(stream, 4))
+    header = json.loads(read_exact(stream, header_length))
+    rows = header['rows']
+    if not rows:
+        return None
+
+    columns = {}
+    for column in header['columns']:
+        raw = zlib.decompress(read_exact(stream, column['length']))
+        name = column['name']
+        if name in INT_COLUMNS or name == 'price':
+            values = array('q')
+            values.frombytes(raw)
+            if name == 'price':
+                values = [Decimal(v) / 100 for v in values]
+        else:
+            values = decode_text_column(raw, rows)
+        if len(values) != rows:
+            raise ValueError(f'column {name} has {len(values)} values for {rows} rows')
+        columns[name] = values
+    return columns
+
+
+def read_pcat(stream):
+    if stream.read(len(PCAT_MAGIC)) != PCAT_MAGIC:
+        raise CatalogFormatError('Not a pcat file')
+    for group_number in itertools.count(1):
+        try:
+            columns = read_pcat_group(stream)
+        except (ValueError, KeyError, TypeError, IndexError, zlib.error) as e:
+            # ValueError covers bad JSON, UTF-8 and array lengths
+            raise CatalogFormatError(f'Row group {group_number} is malformed: {e}')
+        if columns is None:
+            return
+
+        rows = len(next(iter(columns.values()), []))
+        for i in range(rows):
+            yield {name: values[i] for name, values in columns.items()}
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'pcat': read_pcat,
+}
+
+
+def import_catalog(stream, fmt, batch_size=500, log=None):
+    """
+    Validate and bulk-insert (or update) products read from `stream`.
+
+    Rows are checked with the same rules as the product form; invalid rows
+    are skipped and reported through `log`. Categories missing locally are
+    created from ``category_name`` when a valid row has one. When an id
+    appears more than once in a batch the last row wins, since Postgres
+    can't update the same row twice in one ``ON CONFLICT`` statement.
+    Returns a dict with the number of imported and skipped rows.
+    """
+    log = log or (lambda message: None)
+    categories = dict(Category.objects.values_list('id', 'name'))
+    category_choices = [{'id': pk, 'name': name} for pk, name in categories.items()]
+    stats = {'imported': 0, 'skipped': 0}
+    # Product id -> Product, so a repeated id replaces the earlier row
+    batch = {}
+
+    def flush():
+        Product.objects.bulk_create(
+            list(batch.values()),
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['title', 'price', 'description', 'image', 'category'],
+        )
+        stats['imported'] += len(batch)
+        batch.clear()
+
+    with transaction.atomic():
+        for row_number, row in enumerate(READERS[fmt](stream), start=1):
+            try:
+                product_id = int(row.get('id'))
+                category_id = int(row.get('category_id'))
+            except (TypeError, ValueError):
+                log(f'Row {row_number}: id and category_id must be integers')
+                stats['skipped'] += 1
+                continue
+
+            new_category = None
+            if category_id not in categories and row.get('category_name'):
+                new_category = {'id': category_id, 'name': row['category_name']}
+
+            form = ProductForm(
+                data={
+                    'title': row.get('title'),
+                    'price': row.get('price'),
+                    'description': row.get('description'),
+                    'categoryId': category_id,
+                    'image_url': row.get('image') or '',
+                },
+                categories=category_choices + [new_category] if new_category else category_choices,
+            )
+            if not form.is_valid():
+                log(f'Row {row_number}: {form.errors.as_text()}')
+                stats['skipped'] += 1
+                continue
+
+            if new_category:
+                Category.objects.create(**new_category)
+                categories[category_id] = new_category['name']
+                category_choices.append(new_category)
+            if product_id in batch:
+                log(f'Row {row_number}: replaces an earlier row for product {product_id}')
+                stats['skipped'] += 1
+            batch[product_id] = Product(
+                id=product_id,
+                title=form.cleaned_data['title'],
+                price=form.cleaned_data['price'],
+                description=form.cleaned_data['description'],
+                image=form.cleaned_data['image_url'],
+                category_id=category_id,
+            )
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+    catalog_synced.send(sender=Product, stats=stats)
+    return stats
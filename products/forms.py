@@ -1,7 +1,4 @@
 from django import forms
-import requests
-
-BASE_URL = "https://api.escuelajs.co/api/v1/"
 
 class ProductForm(forms.Form):
     title = forms.CharField(widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Título del producto'}))
@@ -0,0 +1,276 @@
+"""
+Write-behind queue for product changes.
+
+Views call `enqueue()`, which stores the mutation, updates the local mirror
+optimistically and returns immediately. `process_pending()` (run by the
+``process_outbox`` command or, with PRODUCT_OUTBOX_AUTOSTART, by a
+background thread in the web worker that stays alive until every mutation
+is done or has failed for good) sends the mutations to the upstream API.
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import Category, Product, ProductMutation
+from .signals import product_changed
+from .sync import parse_product
+from .upstream import BASE_URL, session
+
+# Mutations left in progress longer than this belong to a dead worker
+STALE_AFTER = timedelta(minutes=5)
+MAX_BACKOFF_SECONDS = 15 * 60
+
+_autostart_lock = threading.Lock()
+_autostart_thread = None
+_autostart_wake = threading.Event()
+
+
+class PermanentError(Exception):
+    """The upstream rejected the mutation; retrying will not help."""
+
+
+def enqueue(action, payload=None, product_id=None):
+    """
+    Store a mutation for the upstream API and apply it to the local mirror.
+
+    Submitting the same change twice while the first one is still pending
+    (a double-clicked form, for example) returns the existing mutation.
+    Only the product's latest mutation counts: after X, Y, X the second X
+    is queued again, or Y would end up being the last change applied.
+    """
+    payload = payload or {}
+    with transaction.atomic():
+        latest = ProductMutation.objects.filter(
+            product_id=product_id,
+            status__in=[ProductMutation.PENDING, ProductMutation.IN_PROGRESS],
+        ).order_by('-id').first()
+        if (latest is not None and latest.status == ProductMutation.PENDING
+                and latest.action == action and latest.payload == payload):
+            return latest
+
+        mutation = ProductMutation.objects.create(
+            action=action,
+            product_id=product_id,
+            payload=payload,
+            idempotency_key=uuid.uuid4().hex,
+        )
+        apply_locally(mutation)
+
+    if getattr(settings, 'PRODUCT_OUTBOX_AUTOSTART', False):
+        transaction.on_commit(start_background_worker)
+    return mutation
+
+
+def apply_locally(mutation):
+    """Optimistically reflect a mutation in the local catalog mirror."""
+    if mutation.action == ProductMutation.UPDATE:
+        payload = mutation.payload
+        fields = {
+            'title': payload['title'],
+            'price': payload['price'],
+            'description': payload['description'],
+        }
+        if payload.get('images'):
+            fields['image'] = payload['images'][0]
+        Product.objects.filter(id=mutation.product_id).update(**fields)
+    elif mutation.action == ProductMutation.DELETE:
+        Product.objects.filter(id=mutation.product_id).delete()
+
+    # New products get their id from the API, so creates are mirrored once sent
+    if mutation.product_id is not None:
+        product_changed.send(sender=ProductMutation, product_id=mutation.product_id)
+
+
+def send(mutation):
+    """Send one mutation to the upstream API and return the decoded response."""
+    headers = {'Idempotency-Key': mutation.idempotency_key}
+    if mutation.action == ProductMutation.CREATE:
+        response = session.post(f'{BASE_URL}products/', json=mutation.payload, headers=headers, timeout=30)
+    elif mutation.action == ProductMutation.UPDATE:
+        response = session.put(f'{BASE_URL}products/{mutation.product_id}', json=mutation.payload, headers=headers, timeout=30)
+    else:
+        response = session.delete(f'{BASE_URL}products/{mutation.product_id}', headers=headers, timeout=30)
+
+    # Client errors other than timeouts and rate limiting won't succeed on retry
+    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+        raise PermanentError(f'{response.status_code}: {response.text[:500]}')
+    response.raise_for_status()
+
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def mirror_created_product(product_data):
+    """Insert a product created upstream into the local mirror."""
+    fields = parse_product(product_data)
+    if fields is None or not Category.objects.filter(id=fields['category_id']).exists():
+        return
+    Product.objects.update_or_create(id=product_data['id'], defaults=fields)
+
+
+def claim(mutation):
+    """Mark a pending mutation as in progress; False if another worker got it."""
+    return ProductMutation.objects.filter(
+        pk=mutation.pk, status=ProductMutation.PENDING
+    ).update(
+        status=ProductMutation.IN_PROGRESS,
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now(),
+    ) == 1
+
+
+def run(mutation):
+    """Send a claimed mutation and record the outcome."""
+    try:
+        result = send(mutation)
+    except PermanentError as e:
+        ProductMutation.objects.filter(pk=mutation.pk).update(
+            status=ProductMutation.FAILED, last_error=str(e), updated_at=timezone.now()
+        )
+        return False
+    except requests.exceptions.RequestException as e:
+        attempts = mutation.attempts + 1
+        max_attempts = getattr(settings, 'PRODUCT_OUTBOX_MAX_ATTEMPTS', 8)
+        delay = min(2 ** attempts, MAX_BACKOFF_SECONDS)
+        ProductMutation.objects.filter(pk=mutation.pk).update(
+            status=ProductMutation.FAILED if attempts >= max_attempts else ProductMutation.PENDING,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+            last_error=str(e),
+            updated_at=timezone.now(),
+        )
+        return False
+
+    product_id = mutation.product_id
+    if mutation.action == ProductMutation.CREATE and isinstance(result, dict) and 'id' in result:
+        product_id = result['id']
+        mirror_created_product(result)
+
+    ProductMutation.objects.filter(pk=mutation.pk).update(
+        status=ProductMutation.DONE, product_id=product_id, last_error='', updated_at=timezone.now()
+    )
+    if product_id is not None:
+        product_changed.send(sender=ProductMutation, product_id=product_id)
+    return True
+
+
+def run_in_thread(mutation):
+    try:
+        return run(mutation)
+    finally:
+        connections.close_all()
+
+
+def next_batch(batch_size):
+    """
+    Pending mutations that can run now: for each product only the oldest
+    unfinished mutation is eligible, so changes reach the API in order.
+    """
+    now = timezone.now()
+    ProductMutation.objects.filter(
+        status=ProductMutation.IN_PROGRESS, updated_at__lt=now - STALE_AFTER
+    ).update(status=ProductMutation.PENDING)
+
+    due = list(
+        ProductMutation.objects.filter(status=ProductMutation.PENDING, next_attempt_at__lte=now)
+        .order_by('id')[:batch_size]
+    )
+    product_ids = {m.product_id for m in due if m.product_id is not None}
+    heads = dict(
+        ProductMutation.objects.filter(
+            product_id__in=product_ids,
+            status__in=[ProductMutation.PENDING, ProductMutation.IN_PROGRESS],
+        ).values('product_id').annotate(first=Min('id')).values_list('product_id', 'first')
+    )
+    return [m for m in due if m.product_id is None or heads.get(m.product_id) == m.pk]
+
+
+def process_pending(max_workers=None, batch_size=100):
+    """
+    Apply due mutations with a pool of worker threads until none are left.
+    Returns the number of mutations applied successfully.
+    """
+    max_workers = max_workers or getattr(settings, 'PRODUCT_OUTBOX_WORKERS', 4)
+    applied = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='outbox') as pool:
+        while True:
+            batch = [m for m in next_batch(batch_size) if claim(m)]
+            if not batch:
+                break
+            if max_workers == 1:
+                # No concurrency to gain: run in this thread, on its connection
+                applied += sum(map(run, batch))
+            else:
+                applied += sum(pool.map(run_in_thread, batch))
+    return applied
+
+
+def next_wakeup():
+    """
+    Seconds until a pending mutation may be runnable again, or None when
+    nothing is left unfinished.
+    """
+    unfinished = ProductMutation.objects.filter(
+        status__in=[ProductMutation.PENDING, ProductMutation.IN_PROGRESS]
+    )
+    if not unfinished.exists():
+        return None
+    poll_interval = getattr(settings, 'PRODUCT_OUTBOX_POLL_INTERVAL', 2.0)
+    earliest = unfinished.filter(status=ProductMutation.PENDING).aggregate(at=Min('next_attempt_at'))['at']
+    if earliest is None:
+        # Only mutations in progress elsewhere; they may fail and come back
+        return poll_interval
+    wait = (earliest - timezone.now()).total_seconds()
+    # Due but waiting behind another mutation of the same product
+    return wait if wait > 0 else poll_interval
+
+
+def start_background_worker():
+    """
+    Drain the outbox in a daemon thread of the current process, or wake the
+    running one up so it picks the new mutation immediately.
+    """
+    global _autostart_thread
+    with _autostart_lock:
+        if _autostart_thread is not None and _autostart_thread.is_alive():
+            _autostart_wake.set()
+            return
+        _autostart_thread = threading.Thread(target=drain, name='outbox-autostart', daemon=True)
+        _autostart_thread.start()
+
+
+def drain():
+    """
+    Apply pending mutations until the outbox is empty, sleeping until the
+    next retry is due while failed ones are backed off.
+    """
+    global _autostart_thread
+    try:
+        while True:
+            process_pending()
+            wait = next_wakeup()
+            if wait is None:
+                # Decided under the lock: a start_background_worker call that
+                # saw this thread alive has set the event by now, and one that
+                # comes later finds no thread and starts a new one
+                with _autostart_lock:
+                    if not _autostart_wake.is_set() and next_wakeup() is None:
+                        if _autostart_thread is threading.current_thread():
+                            _autostart_thread = None
+                        return
+                _autostart_wake.clear()
+                continue
+            # The connection isn't needed while sleeping, possibly for minutes
+            connections.close_all()
+            _autostart_wake.wait(wait)
+            _autostart_wake.clear()
+    finally:
+        connections.close_all()
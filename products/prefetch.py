@@ -0,0 +1,113 @@
+"""
+Predictive prefetch of product details.
+
+The product list already has everything the detail page shows, so the
+products it renders are stored as detail cache entries (seed_from_list)
+and the click into a product usually needs no API call.
+
+Visits to a detail page coming from the list are also counted per worker.
+With PRODUCT_PREFETCH_POPULAR a background thread revalidates the
+PRODUCT_PREFETCH_TOP most clicked products every PRODUCT_PREFETCH_INTERVAL
+seconds, through a pool of PRODUCT_PREFETCH_WORKERS threads, before their
+cached copy goes stale. Counts are halved after every round so the ranking
+follows what is popular now.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from . import upstream
+
+logger = logging.getLogger(__name__)
+
+# Products whose cached copy is older than this fraction of
+# PRODUCT_CACHE_FRESH_SECONDS are refreshed by the prefetcher
+REFRESH_AFTER = 0.75
+
+_clicks = Counter()
+_clicks_lock = threading.Lock()
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def seed_from_list(products):
+    """Store the products shown in the list as detail cache entries."""
+    bodies = [p.as_api_dict() if hasattr(p, 'as_api_dict') else p for p in products]
+    return upstream.seed_products([b for b in bodies if isinstance(b, dict) and 'id' in b])
+
+
+def came_from_list(request):
+    referer = request.META.get('HTTP_REFERER')
+    return bool(referer) and urlsplit(referer).path == reverse('product_list')
+
+
+def record_click(product_id):
+    with _clicks_lock:
+        _clicks[product_id] += 1
+    if settings.PRODUCT_PREFETCH_POPULAR:
+        start_prefetcher()
+
+
+def popular(count):
+    with _clicks_lock:
+        return [pk for pk, _ in _clicks.most_common(count)]
+
+
+def decay():
+    with _clicks_lock:
+        for pk in list(_clicks):
+            _clicks[pk] //= 2
+            if not _clicks[pk]:
+                del _clicks[pk]
+
+
+def needs_refresh(pk):
+    entry = cache.get(upstream.product_cache_key(pk))
+    return entry is None or time.time() - entry['fetched_at'] > settings.PRODUCT_CACHE_FRESH_SECONDS * REFRESH_AFTER
+
+
+def refresh(pk):
+    try:
+        upstream.single_flight.do(
+            f'product {pk}',
+            lambda: upstream.load_product(pk, refresh=True),
+            settings.UPSTREAM_COALESCE_TIMEOUT,
+        )
+    except requests.exceptions.RequestException as e:
+        logger.debug('Prefetch of product %s failed: %s', pk, e)
+
+
+def warm_popular(pool):
+    """Refresh the most clicked products that are about to go stale. Returns how many."""
+    due = [pk for pk in popular(settings.PRODUCT_PREFETCH_TOP) if needs_refresh(pk)]
+    list(pool.map(refresh, due))
+    decay()
+    return len(due)
+
+
+def run():
+    with ThreadPoolExecutor(max_workers=settings.PRODUCT_PREFETCH_WORKERS, thread_name_prefix='prefetch') as pool:
+        while True:
+            try:
+                warm_popular(pool)
+            except Exception:
+                logger.exception('Product prefetch round failed')
+            time.sleep(settings.PRODUCT_PREFETCH_INTERVAL)
+
+
+def start_prefetcher():
+    global _prefetcher
+    if _prefetcher is not None:
+        return
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = threading.Thread(target=run, name='product-prefetch', daemon=True)
+            _prefetcher.start()
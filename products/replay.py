@@ -0,0 +1,235 @@
+"""
+Record/replay of the Platzi Fake Store API.
+
+In ``record`` mode every call made through ``upstream.session`` goes to the
+API as usual and the response is also kept in memory; the recording is
+merged into UPSTREAM_SNAPSHOT_PATH when the process exits, under a file
+lock, so every gunicorn worker recording to the same file adds its
+responses to it. ``record_upstream`` replaces the file with a complete
+recording instead. In ``replay`` mode no request leaves the
+process: responses are served from that file, after an optional injected
+latency, so the app, the sync command, tests and load benchmarks run
+deterministically without network.
+
+Snapshot file layout: the ``UPSNAP1\\n`` magic, one zlib-compressed JSON
+document per recorded response, then a compressed JSON index mapping each
+request key to the offset and length of its response, and finally the
+8-byte little-endian offset of that index. The file is memory-mapped and
+only the responses actually requested are decompressed.
+"""
+import atexit
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: recordings from concurrent processes aren't merged safely
+    fcntl = None
+
+MAGIC = b'UPSNAP1\n'
+TRAILER = struct.Struct('<Q')
+# Response headers worth keeping; the rest (dates, cookies, CORS...) would
+# only make the file larger
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class SnapshotError(Exception):
+    """The snapshot file is missing or malformed."""
+
+
+def request_key(method, url, base_url):
+    """Identifies a request by method, path below `base_url` and sorted query string."""
+    parts = urlsplit(url)
+    path = parts.path[len(urlsplit(base_url).path):] if url.startswith(base_url) else parts.path
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f'{method} {path.strip("/")}' + (f'?{query}' if query else '')
+
+
+def write_snapshot(path, entries):
+    """Write `entries` (request key -> response dict) to `path` atomically."""
+    index = {}
+    # One temp file per writer, so concurrent writers never share one
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for key, entry in sorted(entries.items()):
+            block = zlib.compress(json.dumps(entry).encode(), 9)
+            index[key] = (f.tell(), len(block))
+            f.write(block)
+        index_offset = f.tell()
+        f.write(zlib.compress(json.dumps(index).encode(), 9))
+        f.write(TRAILER.pack(index_offset))
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on `path` (through `path`.lock) between processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f'Cannot open upstream snapshot {path}: {e}')
+
+        if self._map[:len(MAGIC)] != MAGIC or len(self._map) < len(MAGIC) + TRAILER.size:
+            raise SnapshotError(f'{path} is not an upstream snapshot')
+        index_offset, = TRAILER.unpack(self._map[-TRAILER.size:])
+        self.index = json.loads(zlib.decompress(self._map[index_offset:-TRAILER.size]))
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key):
+        location = self.index.get(key)
+        if location is None:
+            return None
+        offset, length = location
+        return json.loads(zlib.decompress(self._map[offset:offset + length]))
+
+    def close(self):
+        self._map.close()
+
+    def entries(self):
+        return {key: self.get(key) for key in self.index}
+
+
+def build_response(request, entry):
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.reason = entry.get('reason', '')
+    response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+    response._content = entry['body'].encode('latin-1')
+    response.encoding = 'utf-8'
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Serves requests from a Snapshot. A request that was never recorded
+    fails with ConnectionError, like an unreachable API would.
+    """
+
+    def __init__(self, snapshot, base_url, latency=0.0, jitter=0.0):
+        super().__init__()
+        self.snapshot = snapshot
+        self.base_url = base_url
+        self.latency = latency
+        self.jitter = jitter
+        # Seeded so a benchmark sees the same delays on every run
+        self._random = random.Random(0)
+
+    def send(self, request, **kwargs):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        key = request_key(request.method, request.url, self.base_url)
+        entry = self.snapshot.get(key)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(f'{key} is not in the upstream snapshot', request=request)
+        return build_response(request, entry)
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests normally and stores every response in `entries`."""
+
+    def __init__(self, base_url, entries=None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.entries = {} if entries is None else entries
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        entry = {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: response.headers[k] for k in KEPT_HEADERS if k in response.headers},
+            # latin-1 maps bytes 1:1, so binary bodies survive the JSON round trip
+            'body': response.content.decode('latin-1'),
+        }
+        with self._lock:
+            self.entries[request_key(request.method, request.url, self.base_url)] = entry
+        return response
+
+    def save(self, path, merge=False):
+        """
+        Write the recording to `path`. With `merge`, the responses already
+        in the file (written meanwhile by other processes too) are kept
+        unless this recording has a newer one for the same request.
+        """
+        with self._lock:
+            entries = dict(self.entries)
+        with locked(path):
+            if merge:
+                entries = {**load_existing(path), **entries}
+            write_snapshot(path, entries)
+
+
+def load_existing(path):
+    """Entries already recorded in `path`, so a new recording extends it."""
+    if not os.path.exists(path):
+        return {}
+    snapshot = Snapshot(path)
+    try:
+        return snapshot.entries()
+    finally:
+        snapshot.close()
+
+
+def install(session, base_url, mode, path, latency=0.0, jitter=0.0):
+    """
+    Mount the adapter for `mode` ('live', 'record' or 'replay') on
+    `session` for every URL under `base_url`. Returns the adapter, or None
+    in live mode.
+    """
+    if mode == 'replay':
+        adapter = ReplayAdapter(Snapshot(path), base_url, latency, jitter)
+    elif mode == 'record':
+        # Only this process's responses are kept in memory; the file is read
+        # again on exit, so responses recorded meanwhile by other workers
+        # aren't overwritten with an older copy
+        adapter = RecordingAdapter(base_url)
+        atexit.register(adapter.save, path, merge=True)
+    elif mode == 'live':
+        return None
+    else:
+        raise ValueError(f'Unknown upstream mode: {mode}')
+
+    session.mount(base_url, adapter)
+    return adapter
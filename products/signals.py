@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Sent with `product_id` whenever a product changes locally (optimistic
+# outbox writes) or upstream (after the outbox applies a mutation), so
+# caches holding that product can drop or refresh it.
+product_changed = Signal()
+
+# Sent with `stats` after the local mirror has been bulk-updated by
+# sync_catalog() or a catalog import.
+catalog_synced = Signal()
@@ -0,0 +1,226 @@
+"""
+Immutable in-process snapshot of the local catalog mirror.
+
+Each worker loads the catalog once into compact records with prebuilt
+indexes, so the product list can filter and sort in memory instead of
+calling the API. When the catalog changes (sync or outbox write) the
+shared version key is bumped; workers notice within
+CATALOG_SNAPSHOT_CHECK_INTERVAL seconds, build a new snapshot and swap it
+in with a single reference assignment, so readers never see a half-built
+one.
+"""
+import hashlib
+import sys
+import threading
+import time
+import uuid
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from .models import Category, Product
+from .signals import catalog_synced, product_changed
+
+VERSION_KEY = 'catalog_snapshot_version'
+
+
+class CategoryRecord:
+    __slots__ = ('id', 'name', 'image')
+
+    def __init__(self, id, name, image):
+        self.id = id
+        self.name = name
+        self.image = image
+
+
+class ProductRecord:
+    """A product in the shape the templates expect from the API."""
+    __slots__ = ('id', 'title', 'price', 'description', 'images', 'category')
+
+    def __init__(self, id, title, price, description, images, category):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.description = description
+        self.images = images
+        self.category = category
+
+    def as_api_dict(self):
+        """The product in the JSON shape of the API's products/{id} response."""
+        price = self.price
+        return {
+            'id': self.id,
+            'title': self.title,
+            'price': int(price) if price == int(price) else float(price),
+            'description': self.description,
+            'images': list(self.images),
+            'category': {'id': self.category.id, 'name': self.category.name, 'image': self.category.image},
+        }
+
+
+class CatalogSnapshot:
+    """
+    Read-only view of the catalog.
+
+    Records are kept in id order. Ids, prices and category ids are also
+    stored as typed arrays, and category objects are shared by all their
+    products, keeping the per-worker footprint small and predictable.
+    """
+    __slots__ = ('version', 'loaded_at', 'products', 'categories', 'by_id', 'by_category',
+                 'ids', 'prices', 'category_ids', 'folded_titles', 'price_rank', '_digest')
+
+    def __init__(self, version, categories, products):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.categories = tuple(categories)
+        self.products = tuple(products)
+        self.ids = array('q', (p.id for p in self.products))
+        self.prices = array('d', (float(p.price) for p in self.products))
+        self.category_ids = array('q', (p.category.id for p in self.products))
+        self.folded_titles = tuple(p.title.casefold() for p in self.products)
+        self.by_id = {p.id: i for i, p in enumerate(self.products)}
+
+        by_category = {}
+        for i, category_id in enumerate(self.category_ids):
+            by_category.setdefault(category_id, []).append(i)
+        self.by_category = {k: array('l', v) for k, v in by_category.items()}
+
+        # Position of each product when ordered by price, computed once so
+        # per-request sorts only compare small ints
+        rank = array('l', [0]) * len(self.products)
+        for position, i in enumerate(sorted(range(len(self.products)), key=self.prices.__getitem__)):
+            rank[i] = position
+        self.price_rank = rank
+        self._digest = None
+
+    def __len__(self):
+        return len(self.products)
+
+    def digest(self):
+        """
+        Hash of the catalog contents, computed on first use. Unlike `version`
+        it is the same in every process that loaded the same catalog.
+        """
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            for c in self.categories:
+                h.update(repr((c.id, c.name, c.image)).encode())
+            for p in self.products:
+                h.update(repr((p.id, p.title, str(p.price), p.description, p.images, p.category.id)).encode())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def get(self, product_id):
+        index = self.by_id.get(product_id)
+        return None if index is None else self.products[index]
+
+    def filter(self, query=None, category_id=None, sort=None):
+        """
+        Products whose title contains `query` (case-insensitive) in category
+        `category_id`, optionally sorted by 'price', '-price' or 'title'.
+        """
+        if category_id is not None:
+            indexes = self.by_category.get(category_id, ())
+        else:
+            indexes = range(len(self.products))
+
+        if query:
+            folded = query.casefold()
+            titles = self.folded_titles
+            indexes = [i for i in indexes if folded in titles[i]]
+
+        if sort in ('price', '-price'):
+            indexes = sorted(indexes, key=self.price_rank.__getitem__, reverse=sort == '-price')
+        elif sort == 'title':
+            indexes = sorted(indexes, key=self.folded_titles.__getitem__)
+
+        products = self.products
+        return [products[i] for i in indexes]
+
+
+def build_snapshot(version=None):
+    """Load the catalog mirror into a new CatalogSnapshot."""
+    categories = {
+        category_id: CategoryRecord(category_id, sys.intern(name), image or '')
+        for category_id, name, image in Category.objects.order_by('id').values_list('id', 'name', 'image')
+    }
+    rows = Product.objects.order_by('id').values_list(
+        'id', 'title', 'price', 'description', 'image', 'category_id'
+    )
+    products = [
+        ProductRecord(pk, title, price, description, (image,) if image else (), categories[category_id])
+        for pk, title, price, description, image, category_id in rows.iterator(chunk_size=2000)
+    ]
+    return CatalogSnapshot(version, categories.values(), products)
+
+
+_current = None
+_checked_at = 0.0
+_reload_lock = threading.Lock()
+
+
+def get_snapshot(revalidate=False):
+    """
+    The current catalog snapshot, rebuilt if the shared version changed or
+    it is older than CATALOG_SNAPSHOT_MAX_AGE seconds. The version is checked
+    at most every CATALOG_SNAPSHOT_CHECK_INTERVAL seconds, unless
+    `revalidate` is set.
+    """
+    global _current, _checked_at
+    snapshot = _current
+    now = time.monotonic()
+    if (snapshot is not None and not revalidate
+            and now - _checked_at < settings.CATALOG_SNAPSHOT_CHECK_INTERVAL):
+        return snapshot
+
+    version = cache.get(VERSION_KEY)
+    stale = (
+        snapshot is None
+        or snapshot.version != version
+        or now - snapshot.loaded_at > settings.CATALOG_SNAPSHOT_MAX_AGE
+    )
+    if not stale:
+        _checked_at = now
+        return snapshot
+
+    # Only one thread rebuilds; the others keep serving the previous snapshot
+    if not _reload_lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if _current is snapshot:
+            _current = build_snapshot(version)
+        _checked_at = time.monotonic()
+        return _current
+    finally:
+        _reload_lock.release()
+
+
+def get_list_snapshot():
+    """The catalog snapshot, if the product list should use it and it has products."""
+    if settings.PRODUCT_LIST_SOURCE != 'snapshot':
+        return None
+    snapshot = get_snapshot()
+    return snapshot if len(snapshot) else None
+
+
+def filter_snapshot(snapshot, params):
+    """The products the list shows for the query parameters `params`."""
+    category_id = params.get('category')
+    category = int(category_id) if category_id and category_id.isdigit() else None
+    return snapshot.filter(params.get('q'), category, params.get('sort'))
+
+
+def bump_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(catalog_synced)
+def catalog_synced_bump(sender, **kwargs):
+    bump_version()
+
+
+@receiver(product_changed)
+def product_changed_bump(sender, **kwargs):
+    bump_version()
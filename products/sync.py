@@ -0,0 +1,167 @@
+"""
+Synchronisation of the local catalog mirror with the Platzi Fake Store API.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Category, Product, ProductMutation
+from .signals import catalog_synced
+from .upstream import BASE_URL, session
+
+PRODUCT_FIELDS = ('title', 'price', 'description', 'image', 'category_id')
+
+
+def parse_category(category_data):
+    """Model fields for an API category, or None if the data is invalid."""
+    # The API can return invalid category data
+    if 'id' not in category_data or 'name' not in category_data:
+        return None
+    return {
+        'name': category_data['name'],
+        'image': category_data.get('image', ''),
+    }
+
+
+def parse_product(product_data):
+    """Model fields for an API product, or None if the data is invalid."""
+    if not all(k in product_data for k in ['id', 'title', 'price', 'category']):
+        return None
+
+    # The API has some bad data where the category is not a dict
+    category = product_data.get('category')
+    if not isinstance(category, dict) or 'id' not in category:
+        return None
+
+    # The model expects a single image URL, so we'll take the first one.
+    # Also, the API sometimes returns invalid image URLs in a list of strings.
+    images = product_data.get('images', [])
+    image_url = ''
+    if images and isinstance(images, list) and isinstance(images[0], str) and images[0].startswith('http'):
+        image_url = images[0]
+
+    return {
+        'title': product_data['title'],
+        'price': Decimal(str(product_data['price'])).quantize(Decimal('0.01')),
+        'description': product_data.get('description', ''),
+        'image': image_url,
+        'category_id': category['id'],
+    }
+
+
+def fetch_json(path, params=None):
+    response = session.get(f'{BASE_URL}{path}', params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_all_products(page_size=100, concurrency=4):
+    """
+    Fetch every product page, at most `concurrency` requests at a time.
+
+    The API doesn't report a total, so pages are requested in waves of
+    `concurrency` until one comes back short.
+    """
+    products = []
+    offset = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='catalog-sync') as pool:
+        while True:
+            offsets = [offset + i * page_size for i in range(concurrency)]
+            pages = pool.map(lambda o: fetch_json('products', {'offset': o, 'limit': page_size}), offsets)
+            done = False
+            for page in pages:
+                products.extend(page)
+                if len(page) < page_size:
+                    done = True
+            if done:
+                return products
+            offset += concurrency * page_size
+
+
+def sync_catalog(page_size=100, concurrency=4, log=None):
+    """
+    Bring the local Category/Product tables in line with the API.
+
+    Only rows whose values changed are written, in bulk. Products that no
+    longer exist upstream are deleted. Returns a dict with the duration and
+    the number of rows created, updated and deleted per table.
+    Raises requests.exceptions.RequestException or ValueError if the API
+    can't be read, leaving the mirror untouched.
+    """
+    log = log or (lambda message: None)
+    started = time.monotonic()
+
+    categories_data = fetch_json('categories')
+    products_data = fetch_all_products(page_size, concurrency)
+
+    stats = {
+        'categories_created': 0, 'categories_updated': 0,
+        'products_created': 0, 'products_updated': 0, 'products_deleted': 0,
+    }
+
+    with transaction.atomic():
+        existing_categories = {c.id: c for c in Category.objects.all()}
+        new_categories, changed_categories = [], []
+        for category_data in categories_data:
+            fields = parse_category(category_data)
+            if fields is None:
+                log(f'Skipping invalid category data: {category_data}')
+                continue
+            category = existing_categories.get(category_data['id'])
+            if category is None:
+                category = Category(id=category_data['id'], **fields)
+                new_categories.append(category)
+                existing_categories[category.id] = category
+            elif any(getattr(category, k) != v for k, v in fields.items()):
+                for k, v in fields.items():
+                    setattr(category, k, v)
+                changed_categories.append(category)
+
+        Category.objects.bulk_create(new_categories, batch_size=500)
+        Category.objects.bulk_update(changed_categories, ['name', 'image'], batch_size=500)
+        stats['categories_created'] = len(new_categories)
+        stats['categories_updated'] = len(changed_categories)
+
+        existing_products = {p.id: p for p in Product.objects.all()}
+        # Local changes still waiting in the outbox win over upstream data
+        pending_ids = set(
+            ProductMutation.objects.filter(
+                status__in=[ProductMutation.PENDING, ProductMutation.IN_PROGRESS],
+                product_id__isnull=False,
+            ).values_list('product_id', flat=True)
+        )
+        seen_ids = set(pending_ids)
+        new_products, changed_products = [], []
+        for product_data in products_data:
+            fields = parse_product(product_data)
+            if fields is None:
+                log(f'Skipping invalid product data: {product_data.get("title", product_data)}')
+                continue
+            if fields['category_id'] not in existing_categories:
+                log(f'Category with id {fields["category_id"]} does not exist. Skipping product: {fields["title"]}')
+                continue
+
+            if product_data['id'] in pending_ids:
+                continue
+            seen_ids.add(product_data['id'])
+            product = existing_products.get(product_data['id'])
+            if product is None:
+                new_products.append(Product(id=product_data['id'], **fields))
+            elif any(getattr(product, k) != v for k, v in fields.items()):
+                for k, v in fields.items():
+                    setattr(product, k, v)
+                changed_products.append(product)
+
+        Product.objects.bulk_create(new_products, batch_size=500)
+        Product.objects.bulk_update(changed_products, PRODUCT_FIELDS, batch_size=500)
+        removed = [pk for pk in existing_products if pk not in seen_ids]
+        Product.objects.filter(id__in=removed).delete()
+        stats['products_created'] = len(new_products)
+        stats['products_updated'] = len(changed_products)
+        stats['products_deleted'] = len(removed)
+
+    stats['duration'] = time.monotonic() - started
+    transaction.on_commit(lambda: catalog_synced.send(sender=Product, stats=stats))
+    return stats
@@ -1,3 +1,818 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from requests.adapters import HTTPAdapter
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.management.commands.sync_catalog import Command as SyncCatalogCommand
+from core.models import JobRun
+
+from . import analytics, catalog_io, outbox, prefetch, replay, upstream
+from .models import Category, Product, ProductMutation
+from .snapshot import build_snapshot, bump_version
+from .sync import sync_catalog
+
+API_CATEGORY = {'id': 1, 'name': 'Ropa', 'image': 'https://example.com/ropa.png'}
+API_PRODUCT = {
+    'id': 1,
+    'title': 'Camiseta',
+    'price': 25,
+    'description': 'Camiseta de algodón',
+    'images': ['https://example.com/camiseta.png'],
+    'category': API_CATEGORY,
+}
+
+
+def api_response(body, status=200):
+    return {'status': status, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}
+
+
+# Requests missing here fail like an unreachable API
+UPSTREAM_RESPONSES = {
+    'GET categories': api_response([API_CATEGORY]),
+    'GET products': api_response([API_PRODUCT]),
+    'GET products/1': api_response(API_PRODUCT),
+    'GET products/404': api_response({'message': 'Not found'}, 404),
+}
+
+# Every view runs with its declared query budget enforced
+TEST_SETTINGS = {
+    'QUERY_BUDGET_CHECKS': True,
+    'QUERY_BUDGET_STRICT': True,
+    'PRODUCT_OUTBOX_AUTOSTART': False,
+    'PRODUCT_PREFETCH_POPULAR': False,
+    'PRERENDER_ENABLED': False,
+    'CATALOG_SNAPSHOT_CHECK_INTERVAL': 0,
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+}
+
+
+def content(response):
+    if response.streaming:
+        return b''.join(response.streaming_content).decode()
+    return response.content.decode()
+
+
+def replay_snapshot(responses):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'upstream.bin')
+    replay.write_snapshot(path, responses)
+    snapshot = replay.Snapshot(path)
+    os.remove(path)
+    os.rmdir(directory)
+    return snapshot
+
+
+class ReplayedUpstreamTestCase(TestCase):
+    """Serves the API from an upstream snapshot instead of the network."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.snapshot = replay_snapshot(UPSTREAM_RESPONSES)
+        upstream.session.mount(upstream.BASE_URL, replay.ReplayAdapter(cls.snapshot, upstream.BASE_URL))
+
+    @classmethod
+    def tearDownClass(cls):
+        upstream.session.mount(upstream.BASE_URL, upstream.replay_adapter or HTTPAdapter())
+        cls.snapshot.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        upstream.local_products.clear()
+        prefetch._clicks.clear()
+        bump_version()
+
+    def serve_upstream(self, responses):
+        """Answer with `responses` (plus UPSTREAM_RESPONSES) for the rest of the test."""
+        snapshot = replay_snapshot({**UPSTREAM_RESPONSES, **responses})
+        upstream.session.mount(upstream.BASE_URL, replay.ReplayAdapter(snapshot, upstream.BASE_URL))
+        self.addCleanup(snapshot.close)
+        self.addCleanup(upstream.session.mount, upstream.BASE_URL, replay.ReplayAdapter(self.snapshot, upstream.BASE_URL))
+
+
+@override_settings(**TEST_SETTINGS)
+class ProductViewTests(ReplayedUpstreamTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(id=1, name='Ropa')
+        Product.objects.create(id=1, title='Camiseta', price=25, description='Algodón', category=category)
+        Product.objects.create(id=2, title='Pantalón', price=40, description='Mezclilla', category=category)
+        cls.user = User.objects.create_user('ana', password='secreta-123')
+        cls.admin = User.objects.create_user('jefa', password='secreta-123', is_staff=True)
+
+    def test_product_list(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Pantalón', content(response))
+
+    def test_product_list_filters_snapshot(self):
+        response = self.client.get(reverse('product_list'), {'q': 'cami', 'category': '1'})
+        page = content(response)
+        self.assertIn('Camiseta', page)
+        self.assertNotIn('Pantalón', page)
+
+    @override_settings(PRODUCT_LIST_SOURCE='upstream', PRODUCT_LIST_STREAMING=False)
+    def test_product_list_from_upstream(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Camiseta')
+
+    def test_product_detail(self):
+        response = self.client.get(reverse('product_detail', args=[1]))
+        self.assertContains(response, 'Camiseta de algodón')
+
+    def test_product_detail_from_list_needs_no_upstream_call(self):
+        # Product 2 is not in the recorded API responses
+        content(self.client.get(reverse('product_list')))
+        response = self.client.get(reverse('product_detail', args=[2]), HTTP_REFERER='http://testserver/products/')
+        self.assertContains(response, 'Mezclilla')
+        self.assertEqual(prefetch.popular(1), [2])
+
+    def test_product_detail_upstream_error(self):
+        response = self.client.get(reverse('product_detail', args=[404]))
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+
+    def test_product_create_requires_login(self):
+        response = self.client.get(reverse('product_create'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('accounts:login'), response['Location'])
+
+    def test_product_create(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('product_create')).status_code, 200)
+
+        response = self.client.post(reverse('product_create'), {
+            'title': 'Gorra', 'price': '12.50', 'description': 'Gorra azul', 'categoryId': '1',
+            'image_url': 'https://example.com/gorra.png',
+        })
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.assertTrue(ProductMutation.objects.filter(action=ProductMutation.CREATE).exists())
+
+    def test_product_edit(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('product_edit', args=[1])), 'Camiseta')
+
+        response = self.client.post(reverse('product_edit', args=[1]), {
+            'title': 'Camiseta roja', 'price': '30', 'description': 'Algodón', 'categoryId': '1',
+        })
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.assertEqual(Product.objects.get(id=1).title, 'Camiseta roja')
+
+    def test_product_delete(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('product_delete', args=[2]))
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.assertFalse(Product.objects.filter(id=2).exists())
+        self.assertTrue(ProductMutation.objects.filter(action=ProductMutation.DELETE, product_id=2).exists())
+
+    def test_price_stats_requires_admin(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('product_price_stats')).status_code, 403)
+
+    def test_price_stats(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('product_price_stats'), {'bins': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['overall']['count'], 2)
+
+    def test_catalog_export_requires_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('catalog_export', args=['csv'])).status_code, 302)
+
+    def test_catalog_export(self):
+        self.client.force_login(self.admin)
+        for fmt in ('csv', 'jsonl', 'pcat'):
+            response = self.client.get(reverse('catalog_export', args=[fmt]))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(content(response) if fmt != 'pcat' else b''.join(response.streaming_content))
+        self.assertEqual(self.client.get(reverse('catalog_export', args=['xml'])).status_code, 404)
+
+
+@override_settings(**TEST_SETTINGS)
+class PrefetchTests(ReplayedUpstreamTestCase):
+    def test_seed_does_not_replace_cached_products(self):
+        upstream.get_product(1)
+        self.assertEqual(prefetch.seed_from_list([{**API_PRODUCT, 'title': 'Vieja'}, {**API_PRODUCT, 'id': 7}]), 1)
+        self.assertEqual(upstream.get_product(1)['title'], 'Camiseta')
+        self.assertEqual(upstream.get_product(7)['id'], 7)
+
+    def test_warm_popular_refreshes_most_clicked(self):
+        for pk in (1, 1, 1, 404):
+            prefetch.record_click(pk)
+        self.assertEqual(prefetch.popular(2), [1, 404])
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(prefetch.warm_popular(pool), 2)
+        self.assertFalse(prefetch.needs_refresh(1))
+        # Counts decay after every round
+        self.assertEqual(prefetch._clicks[1], 1)
+        self.assertNotIn(404, prefetch._clicks)
+
+
+@override_settings(**TEST_SETTINGS)
+class OutboxTests(ReplayedUpstreamTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(id=1, name='Ropa')
+        Product.objects.create(id=1, title='Camiseta', price=25, description='Algodón', category=category)
+        Product.objects.create(id=2, title='Pantalón', price=40, description='Mezclilla', category=category)
+
+    def update(self, product_id, title):
+        return outbox.enqueue(ProductMutation.UPDATE, {'title': title, 'price': 10, 'description': 'x'}, product_id)
+
+    def test_double_submit_returns_the_pending_mutation(self):
+        self.assertEqual(self.update(1, 'X'), self.update(1, 'X'))
+        self.assertEqual(ProductMutation.objects.count(), 1)
+
+    def test_reverting_a_change_is_queued_again(self):
+        first, second, third = self.update(1, 'X'), self.update(1, 'Y'), self.update(1, 'X')
+        self.assertNotEqual(first, third)
+        self.assertEqual(Product.objects.get(id=1).title, 'X')
+        self.assertEqual(list(ProductMutation.objects.order_by('id')), [first, second, third])
+
+    def test_failed_mutation_is_backed_off_then_retried(self):
+        # No recorded response for the PUT: the API looks unreachable
+        mutation = self.update(1, 'X')
+        self.assertEqual(outbox.process_pending(max_workers=1), 0)
+        mutation.refresh_from_db()
+        self.assertEqual((mutation.status, mutation.attempts), (ProductMutation.PENDING, 1))
+        self.assertAlmostEqual(outbox.next_wakeup(), 2, delta=0.5)
+
+        # Not retried before the backoff has passed
+        outbox.process_pending(max_workers=1)
+        mutation.refresh_from_db()
+        self.assertEqual(mutation.attempts, 1)
+
+        self.serve_upstream({'PUT products/1': api_response({**API_PRODUCT, 'title': 'X'})})
+        ProductMutation.objects.filter(pk=mutation.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.process_pending(max_workers=1), 1)
+        mutation.refresh_from_db()
+        self.assertEqual((mutation.status, mutation.attempts), (ProductMutation.DONE, 2))
+        self.assertIsNone(outbox.next_wakeup())
+
+    @override_settings(PRODUCT_OUTBOX_MAX_ATTEMPTS=1)
+    def test_mutation_fails_after_max_attempts(self):
+        mutation = self.update(1, 'X')
+        outbox.process_pending(max_workers=1)
+        mutation.refresh_from_db()
+        self.assertEqual(mutation.status, ProductMutation.FAILED)
+
+    def test_mutations_of_a_product_run_in_order(self):
+        first, second = self.update(1, 'X'), self.update(1, 'Y')
+        other = self.update(2, 'Z')
+        self.assertEqual(outbox.next_batch(10), [first, other])
+
+        ProductMutation.objects.filter(pk=first.pk).update(status=ProductMutation.DONE)
+        self.assertEqual(outbox.next_batch(10), [second, other])
+
+    @override_settings(PRODUCT_OUTBOX_WORKERS=1)
+    def test_mutation_enqueued_while_the_worker_exits_is_applied(self):
+        self.serve_upstream({'PUT products/1': api_response({**API_PRODUCT, 'title': 'X'})})
+        next_wakeup = outbox.next_wakeup
+        enqueued = []
+
+        def enqueue_when_empty():
+            wait = next_wakeup()
+            if wait is None and not enqueued:
+                # Lands after the worker found the outbox empty, before it exits
+                enqueued.append(self.update(1, 'X'))
+                outbox.start_background_worker()
+            return wait
+
+        # drain runs in this thread, which start_background_worker sees alive
+        outbox._autostart_thread = threading.current_thread()
+        self.addCleanup(setattr, outbox, '_autostart_thread', None)
+        with mock.patch.object(outbox, 'next_wakeup', side_effect=enqueue_when_empty):
+            outbox.drain()
+
+        enqueued[0].refresh_from_db()
+        self.assertEqual(enqueued[0].status, ProductMutation.DONE)
+        self.assertIsNone(outbox._autostart_thread)
+        self.assertFalse(outbox._autostart_wake.is_set())
+
+    def test_backed_off_mutation_blocks_later_ones(self):
+        first, second = self.update(1, 'X'), self.update(1, 'Y')
+        ProductMutation.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(outbox.next_batch(10), [])
+        # Due, but it waits behind the earlier change to the same product
+        second.refresh_from_db()
+        self.assertEqual(second.status, ProductMutation.PENDING)
+        self.assertLessEqual(second.next_attempt_at, timezone.now())
+
+
+@override_settings(**TEST_SETTINGS)
+class SyncCatalogTests(ReplayedUpstreamTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(id=1, name='Ropa', image='https://example.com/ropa.png')
+        for pk, title in ((1, 'Camiseta'), (2, 'Pantalón'), (3, 'Gorra'), (5, 'Bufanda')):
+            Product.objects.create(id=pk, title=title, price=25, description='Camiseta de algodón',
+                                   image='https://example.com/camiseta.png', category=category)
+
+    def serve_catalog(self, products):
+        self.serve_upstream({
+            'GET categories': api_response([API_CATEGORY]),
+            'GET products?limit=10&offset=0': api_response(products),
+        })
+
+    def test_creates_updates_and_deletes(self):
+        self.serve_catalog([
+            API_PRODUCT,
+            {**API_PRODUCT, 'id': 3, 'title': 'Gorra', 'price': 12},
+            {**API_PRODUCT, 'id': 4, 'title': 'Zapatos'},
+        ])
+        stats = sync_catalog(page_size=10, concurrency=1)
+
+        self.assertEqual(
+            (stats['products_created'], stats['products_updated'], stats['products_deleted']), (1, 1, 2)
+        )
+        self.assertEqual(set(Product.objects.values_list('id', flat=True)), {1, 3, 4})
+        self.assertEqual(Product.objects.get(id=3).price, 12)
+        self.assertEqual(Product.objects.get(id=4).title, 'Zapatos')
+
+    def test_unchanged_catalog_writes_nothing(self):
+        self.serve_catalog([API_PRODUCT, *({**API_PRODUCT, 'id': pk, 'title': t} for pk, t in (
+            (2, 'Pantalón'), (3, 'Gorra'), (5, 'Bufanda')))])
+        stats = sync_catalog(page_size=10, concurrency=1)
+        self.assertEqual(stats['products_updated'], 0)
+        self.assertEqual(stats['categories_updated'], 0)
+
+    def test_products_with_pending_changes_keep_local_data(self):
+        ProductMutation.objects.create(action=ProductMutation.UPDATE, product_id=3, idempotency_key='a')
+        ProductMutation.objects.create(action=ProductMutation.DELETE, product_id=5, idempotency_key='b',
+                                       status=ProductMutation.IN_PROGRESS)
+        # Product 3 changed upstream and 5 is gone, but both have outbox rows
+        self.serve_catalog([{**API_PRODUCT, 'id': 3, 'title': 'Otra'}])
+        stats = sync_catalog(page_size=10, concurrency=1)
+
+        self.assertEqual(Product.objects.get(id=3).title, 'Gorra')
+        self.assertTrue(Product.objects.filter(id=5).exists())
+        self.assertEqual(stats['products_deleted'], 2)
+
+    def test_command_records_the_sync_and_other_nodes_skip(self):
+        self.serve_catalog([API_PRODUCT])
+        call_command('sync_catalog', '--once', '--page-size', '10', '--concurrency', '1', stdout=StringIO())
+        self.assertTrue(JobRun.objects.filter(name='catalog_sync').exists())
+
+        output = StringIO()
+        command = SyncCatalogCommand(stdout=output)
+        command.sync_round({'interval': 300, 'jitter': 0.1, 'once': False})
+        self.assertIn('synced the catalog recently', output.getvalue())
+
+
+class PriceStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ropa = Category.objects.create(id=1, name='Ropa')
+        hogar = Category.objects.create(id=2, name='Hogar')
+        for pk, (price, category) in enumerate([
+            (7, ropa), (10, ropa), (25.5, hogar), (40, ropa), (55, hogar), (99.99, hogar), (99.99, ropa),
+        ], start=1):
+            Product.objects.create(id=pk, title=f'P{pk}', price=price, description='-', category=category)
+
+    def assertStatsEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for key, value in first.items():
+            if isinstance(value, dict):
+                self.assertStatsEqual(value, second[key])
+            elif isinstance(value, list) and value and isinstance(value[0], dict):
+                for a, b in zip(value, second[key], strict=True):
+                    self.assertStatsEqual(a, b)
+            elif isinstance(value, list):
+                for a, b in zip(value, second[key], strict=True):
+                    self.assertAlmostEqual(a, b)
+            elif isinstance(value, float):
+                self.assertAlmostEqual(value, second[key])
+            else:
+                self.assertEqual(value, second[key])
+
+    def test_numpy_and_python_agree(self):
+        if analytics.load_numpy() is None:
+            self.skipTest('NumPy is not installed')
+        snapshot = build_snapshot()
+        with_numpy = analytics.compute_price_stats(snapshot, bins=4)
+        with mock.patch.object(analytics, 'load_numpy', return_value=None):
+            without_numpy = analytics.compute_price_stats(snapshot, bins=4)
+        self.assertStatsEqual(with_numpy, without_numpy)
+        self.assertEqual(with_numpy['overall']['histogram'], [3, 1, 1, 2])
+
+    @override_settings(CATALOG_SNAPSHOT_CHECK_INTERVAL=0)
+    def test_cached_stats_follow_the_catalog_contents(self):
+        bump_version()
+        self.assertEqual(analytics.get_price_stats()['overall']['count'], 7)
+        Product.objects.filter(id=1).delete()
+        bump_version()
+        self.assertEqual(analytics.get_price_stats()['overall']['count'], 6)
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        ropa = Category.objects.create(id=1, name='Ropa')
+        Product.objects.create(id=1, title='Camiseta', price='10.50', description='Algodón, talla M',
+                               image='https://example.com/c.png', category=ropa)
+        Product.objects.create(id=2, title='Gorra "retro"', price='7', description='Línea 1\nLínea 2',
+                               image='', category=ropa)
+
+    def catalog(self):
+        return list(Product.objects.order_by('id').values_list('id', 'title', 'price', 'description', 'image',
+                                                               'category_id', 'category__name'))
+
+    def test_round_trip(self):
+        expected = self.catalog()
+        for fmt in catalog_io.FORMATS:
+            with self.subTest(fmt=fmt):
+                data = b''.join(catalog_io.export_catalog(fmt, chunk_size=1))
+                Product.objects.all().delete()
+                Category.objects.all().delete()
+                stats = catalog_io.import_catalog(BytesIO(data), fmt)
+                self.assertEqual(stats, {'imported': 2, 'skipped': 0})
+                self.assertEqual(self.catalog(), expected)
+
+    def test_malformed_input(self):
+        pcat = b''.join(catalog_io.export_catalog('pcat'))
+        header_length = int.from_bytes(pcat[6:10], 'little')
+        blocks = 10 + header_length
+        cases = [
+            ('csv', b'id,title\n1,\xff\xfe\n'),
+            ('jsonl', b'{"id": 1}\n{"id": \n'),
+            ('jsonl', b'[1, 2]\n'),
+            ('jsonl', b'{"title": "\xff"}\n'),
+            ('pcat', b'CSV1\n'),
+            ('pcat', pcat[:8]),
+            ('pcat', pcat[:10] + b'[' + pcat[11:]),
+            ('pcat', pcat[:10] + b'\xff' + pcat[11:]),
+            ('pcat', pcat[:blocks] + b'not zlib' + pcat[blocks + 8:]),
+            ('pcat', pcat[:blocks + 20]),
+        ]
+        for fmt, data in cases:
+            with self.subTest(fmt=fmt, data=data[:20]):
+                with self.assertRaises(catalog_io.CatalogFormatError):
+                    catalog_io.import_catalog(BytesIO(data), fmt)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_repeated_ids_in_a_batch_keep_the_last_row(self):
+        data = (b'{"id": 3, "title": "Bolso", "price": "5", "description": "a", "category_id": 1}\n'
+                b'{"id": 3, "title": "Bolso grande", "price": "9", "description": "b", "category_id": 1}\n')
+        messages = []
+        stats = catalog_io.import_catalog(BytesIO(data), 'jsonl', log=messages.append)
+        self.assertEqual(stats, {'imported': 1, 'skipped': 1})
+        self.assertEqual(Product.objects.get(id=3).title, 'Bolso grande')
+        self.assertIn('product 3', messages[0])
+
+    def test_categories_are_only_created_for_valid_rows(self):
+        data = (b'{"id": 3, "title": "", "price": "5", "description": "a", '
+                b'"category_id": 7, "category_name": "Hogar"}\n'
+                b'{"id": 4, "title": "Vaso", "price": "2", "description": "b", '
+                b'"category_id": 8, "category_name": "Cocina"}\n')
+        stats = catalog_io.import_catalog(BytesIO(data), 'jsonl')
+        self.assertEqual(stats, {'imported': 1, 'skipped': 1})
+        self.assertFalse(Category.objects.filter(id=7).exists())
+        self.assertEqual(Product.objects.get(id=4).category.name, 'Cocina')
+
+    def test_command_reports_malformed_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.pcat') as f:
+            f.write(b''.join(catalog_io.export_catalog('pcat'))[:60])
+            f.flush()
+            with self.assertRaises(CommandError):
+                call_command('import_catalog', f.name, stdout=StringIO())
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(404 if 'missing' in self.path else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', f'"{len(self.path)}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ScriptedApiHandler(BaseHTTPRequestHandler):
+    """Answers with the next (status, headers, body) in server.script and records the request headers."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        status, headers, body = self.server.script.pop(0)
+        body = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(PRODUCT_CACHE_FRESH_SECONDS=60)
+class ConditionalProductFetchTests(SimpleTestCase):
+    VALIDATORS = {'ETag': '"v1"', 'Last-Modified': 'Wed, 01 Oct 2025 10:00:00 GMT'}
+
+    def setUp(self):
+        self.api = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedApiHandler)
+        self.api.requests, self.api.script = [], []
+        threading.Thread(target=self.api.serve_forever, args=(0.01,), daemon=True).start()
+        self.addCleanup(self.api.server_close)
+        self.addCleanup(self.api.shutdown)
+        patcher = mock.patch.object(upstream, 'BASE_URL', f'http://127.0.0.1:{self.api.server_address[1]}/api/v1/')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        upstream.cache.clear()
+        upstream.local_products.clear()
+
+    def cached(self, pk=1):
+        return upstream.cache.get(upstream.product_cache_key(pk))
+
+    def fetch_then_age(self):
+        """Fetch product 1 (200 with validators) and make the cached copy stale."""
+        self.api.script.append((200, self.VALIDATORS, API_PRODUCT))
+        upstream.get_product(1)
+        entry = self.cached()
+        entry['fetched_at'] -= 120
+        upstream.cache.set(upstream.product_cache_key(1), entry)
+        upstream.local_products.clear()
+        return entry
+
+    def test_first_fetch_stores_the_validators(self):
+        self.api.script.append((200, self.VALIDATORS, API_PRODUCT))
+        self.assertEqual(upstream.get_product(1), API_PRODUCT)
+        self.assertNotIn('If-None-Match', self.api.requests[0])
+        entry = self.cached()
+        self.assertEqual((entry['etag'], entry['last_modified']), ('"v1"', self.VALIDATORS['Last-Modified']))
+
+        # Fresh: answered from the caches without asking the API
+        upstream.local_products.clear()
+        self.assertEqual(upstream.get_product(1), API_PRODUCT)
+        self.assertEqual(len(self.api.requests), 1)
+
+    def test_stale_copy_is_revalidated(self):
+        stale = self.fetch_then_age()
+        self.api.script.append((304, {}, None))
+        self.assertEqual(upstream.get_product(1), API_PRODUCT)
+
+        self.assertEqual(self.api.requests[1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.api.requests[1]['If-Modified-Since'], self.VALIDATORS['Last-Modified'])
+        self.assertGreater(self.cached()['fetched_at'], stale['fetched_at'])
+        self.assertEqual(self.cached()['body'], API_PRODUCT)
+
+    def test_changed_product_replaces_the_copy(self):
+        self.fetch_then_age()
+        changed = {**API_PRODUCT, 'title': 'Camiseta azul'}
+        self.api.script.append((200, {'ETag': '"v2"'}, changed))
+        self.assertEqual(upstream.get_product(1), changed)
+        self.assertEqual((self.cached()['etag'], self.cached()['last_modified']), ('"v2"', None))
+
+    def test_api_error_serves_the_stale_copy(self):
+        stale = self.fetch_then_age()
+        self.api.script.append((500, {}, {'message': 'error'}))
+        self.assertEqual(upstream.get_product(1), API_PRODUCT)
+        # Still stale, so the next request tries the API again
+        self.assertEqual(self.cached()['fetched_at'], stale['fetched_at'])
+
+    def test_api_error_without_a_copy_raises(self):
+        self.api.script.append((500, {}, {'message': 'error'}))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            upstream.get_product(1)
+        self.assertIsNone(self.cached())
+
+    def test_deleted_product_is_dropped(self):
+        self.fetch_then_age()
+        upstream.local_products.set(1, self.cached())
+        self.api.script.append((404, {}, {'message': 'not found'}))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            upstream.load_product(1, refresh=True)
+        self.assertIsNone(self.cached())
+        self.assertIsNone(upstream.local_products.get(1))
+
+    def test_local_copy_expires_after_its_ttl(self):
+        lru = upstream.LocalLRUCache(max_size=2, ttl=5)
+        with mock.patch.object(upstream.time, 'monotonic', return_value=100):
+            lru.set(1, 'a')
+            lru.set(2, 'b')
+            lru.get(1)
+            lru.set(3, 'c')
+        # The least recently used entry made room for the new one
+        with mock.patch.object(upstream.time, 'monotonic', return_value=104.9):
+            self.assertEqual((lru.get(1), lru.get(2), lru.get(3)), ('a', None, 'c'))
+        with mock.patch.object(upstream.time, 'monotonic', return_value=105.1):
+            self.assertIsNone(lru.get(1))
+
+
+class RecordReplayTests(SimpleTestCase):
+    def setUp(self):
+        api = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+        threading.Thread(target=api.serve_forever, args=(0.01,), daemon=True).start()
+        self.addCleanup(api.server_close)
+        self.addCleanup(api.shutdown)
+        self.base_url = f'http://127.0.0.1:{api.server_address[1]}/api/v1/'
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'upstream.bin')
+
+    def record(self, *paths):
+        session = requests.Session()
+        adapter = replay.RecordingAdapter(self.base_url)
+        session.mount(self.base_url, adapter)
+        responses = {path: session.get(f'{self.base_url}{path}', timeout=5) for path in paths}
+        return adapter, responses
+
+    def test_record_then_replay(self):
+        adapter, recorded = self.record('categories', 'products?offset=0&limit=10', 'products/missing')
+        adapter.save(self.path)
+
+        session = requests.Session()
+        replay_adapter = replay.install(session, self.base_url, 'replay', self.path)
+        self.addCleanup(replay_adapter.snapshot.close)
+        # The query string is matched whatever its order
+        for path, url in [('categories', 'categories'), ('products?offset=0&limit=10', 'products?limit=10&offset=0'),
+                          ('products/missing', 'products/missing')]:
+            replayed = session.get(f'{self.base_url}{url}')
+            self.assertEqual(replayed.status_code, recorded[path].status_code)
+            self.assertEqual(replayed.json(), recorded[path].json())
+            self.assertEqual(replayed.headers['ETag'], recorded[path].headers['ETag'])
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.get(f'{self.base_url}products/1')
+
+    def test_workers_recording_to_the_same_file(self):
+        with mock.patch.object(replay.atexit, 'register') as register:
+            adapter = replay.install(requests.Session(), self.base_url, 'record', self.path)
+        register.assert_called_once_with(adapter.save, self.path, merge=True)
+
+        first, _ = self.record('categories', 'products/1')
+        second, _ = self.record('products/2')
+        second.entries['GET categories'] = {'status': 200, 'body': '[]'}
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda a: a.save(self.path, merge=True), [first, second] * 4))
+
+        entries = replay.load_existing(self.path)
+        self.assertEqual(sorted(entries), ['GET categories', 'GET products/1', 'GET products/2'])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['upstream.bin', 'upstream.bin.lock'])
+
+        # record_upstream replaces the file with its own recording
+        second.save(self.path)
+        self.assertEqual(sorted(replay.load_existing(self.path)), ['GET categories', 'GET products/2'])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.single_flight = upstream.SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow_call(self, result=None, error=None):
+        def call():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return call
+
+    def run_concurrently(self, fn, count=5, timeout=5):
+        outcomes = [None] * count
+
+        def caller(i):
+            try:
+                outcomes[i] = self.single_flight.do('key', fn, timeout)
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=caller, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        # Give every caller time to join the in-flight call before it finishes
+        time.sleep(0.2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_concurrent_calls_share_one_request(self):
+        outcomes = self.run_concurrently(self.slow_call(result=[1, 2]))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [[1, 2]] * 5)
+
+    def test_error_reaches_every_caller(self):
+        error = requests.exceptions.ConnectionError('down')
+        outcomes = self.run_concurrently(self.slow_call(error=error))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+
+    def test_waiter_times_out(self):
+        leader = threading.Thread(target=self.single_flight.do, args=('key', self.slow_call(result=1)))
+        leader.start()
+        time.sleep(0.05)
+        with self.assertRaises(upstream.CoalescedRequestTimeout):
+            self.single_flight.do('key', self.slow_call(result=1), timeout=0.01)
+        self.release.set()
+        leader.join()
+
+    def test_calls_after_completion_run_again(self):
+        self.release.set()
+        self.single_flight.do('key', self.slow_call(result=1))
+        self.single_flight.do('key', self.slow_call(result=1))
+        self.assertEqual(self.calls, 2)
+
+
+@override_settings(UPSTREAM_COALESCE_RESULT_TTL=2)
+class SharedSingleFlightTests(SimpleTestCase):
+    """
+    This process uses one cache client and a second client on the same
+    cache plays the other worker.
+    """
+
+    def setUp(self):
+        self.cache = LocMemCache('shared-single-flight', {})
+        self.other = LocMemCache('shared-single-flight', {})
+        self.addCleanup(self.cache.clear)
+        patcher = mock.patch.object(upstream, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+
+    def call(self, result=None, error=None):
+        def call():
+            self.calls += 1
+            if error is not None:
+                raise error
+            return result
+        return call
+
+    def other_worker(self, outcome, after=0.1):
+        """Take the lock as another worker and publish `outcome` after `after` seconds."""
+        self.other.add('single_flight_lock_key', 'other', 30)
+
+        def finish():
+            time.sleep(after)
+            if outcome is not None:
+                self.other.set('single_flight_result_key_other', outcome, 2)
+            self.other.delete('single_flight_lock_key')
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_leader_holds_the_lock_and_publishes_the_result(self):
+        def fn():
+            self.lock_owner = self.other.get('single_flight_lock_key')
+            return [1, 2]
+
+        self.assertEqual(upstream.shared_single_flight('key', fn, 5), [1, 2])
+        self.assertIsNotNone(self.lock_owner)
+        self.assertIsNone(self.other.get('single_flight_lock_key'))
+        self.assertEqual(self.other.get(f'single_flight_result_key_{self.lock_owner}'), {'value': [1, 2]})
+
+    def test_follower_gets_the_other_workers_result(self):
+        self.other_worker({'value': [1, 2]})
+        self.assertEqual(upstream.shared_single_flight('key', self.call(result=[3]), 5), [1, 2])
+        self.assertEqual(self.calls, 0)
+
+    def test_follower_gets_the_other_workers_error(self):
+        self.other_worker({'error': 'down'})
+        with self.assertRaisesMessage(requests.exceptions.RequestException, 'down'):
+            upstream.shared_single_flight('key', self.call(result=[3]), 5)
+        self.assertEqual(self.calls, 0)
+
+    def test_follower_times_out(self):
+        self.other.add('single_flight_lock_key', 'other', 30)
+        with self.assertRaises(upstream.CoalescedRequestTimeout):
+            upstream.shared_single_flight('key', self.call(result=[3]), 0.1)
+        self.assertEqual(self.calls, 0)
+
+    def test_follower_takes_over_when_the_lock_holder_dies(self):
+        # The lock expires without a result being published
+        self.other_worker(None)
+        self.assertEqual(upstream.shared_single_flight('key', self.call(result=[3]), 5), [3])
+        self.assertEqual(self.calls, 1)
+
+    def test_later_callers_do_not_reuse_a_finished_result(self):
+        upstream.shared_single_flight('key', self.call(result=[1]), 5)
+        self.assertEqual(upstream.shared_single_flight('key', self.call(result=[2]), 5), [2])
+        self.assertEqual(self.calls, 2)
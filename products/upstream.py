@@ -0,0 +1,314 @@
+"""
+Access to the Platzi Fake Store API.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from . import replay
+from .signals import catalog_synced, product_changed
+
+BASE_URL = "https://api.escuelajs.co/api/v1/"
+
+# Shared session so consecutive calls reuse the TCP/TLS connection. Every
+# call to the API must go through it so UPSTREAM_MODE applies everywhere.
+session = requests.Session()
+replay_adapter = replay.install(
+    session,
+    BASE_URL,
+    mode=getattr(settings, 'UPSTREAM_MODE', 'live'),
+    path=getattr(settings, 'UPSTREAM_SNAPSHOT_PATH', 'upstream_snapshot.bin'),
+    latency=getattr(settings, 'UPSTREAM_REPLAY_LATENCY_MS', 0) / 1000,
+    jitter=getattr(settings, 'UPSTREAM_REPLAY_JITTER_MS', 0) / 1000,
+)
+
+
+class CoalescedRequestTimeout(requests.exceptions.Timeout):
+    """Gave up waiting for an identical request made by another caller."""
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Request coalescing: at most one call per key runs at a time in this
+    process. Callers arriving while it is in flight wait for it and get
+    the same result, or the same exception. The shared result must be
+    treated as read-only.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise CoalescedRequestTimeout(f'Timed out waiting for in-flight request {key}')
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+
+single_flight = SingleFlight()
+
+
+def shared_single_flight(key, fn, timeout):
+    """
+    Cross-process coalescing through the shared cache. The first caller
+    takes a lock with `cache.add`, storing a token of its own, runs `fn`
+    and publishes its result (or error message) under that token. Callers
+    that found the lock taken poll for the result of that token only, so
+    a caller arriving after the call finished runs `fn` again instead of
+    reusing an old result; UPSTREAM_COALESCE_RESULT_TTL only has to outlive
+    the waiters' polling. If the lock holder dies, its lock expires without
+    a result and a waiter runs `fn` itself.
+    """
+    lock_key = f'single_flight_lock_{key}'
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    owner = uuid.uuid4().hex
+    while True:
+        if cache.add(lock_key, owner, int(timeout) + 1):
+            result_key = f'single_flight_result_{key}_{owner}'
+            try:
+                value = fn()
+            except requests.exceptions.RequestException as e:
+                cache.set(result_key, {'error': str(e)}, settings.UPSTREAM_COALESCE_RESULT_TTL)
+                raise
+            else:
+                cache.set(result_key, {'value': value}, settings.UPSTREAM_COALESCE_RESULT_TTL)
+                return value
+            finally:
+                if cache.get(lock_key) == owner:
+                    cache.delete(lock_key)
+
+        leader = cache.get(lock_key)
+        while leader is not None:
+            result_key = f'single_flight_result_{key}_{leader}'
+            outcome = cache.get(result_key)
+            if outcome is None and cache.get(lock_key) != leader:
+                # It finished between the two reads, or died and its lock expired
+                outcome = cache.get(result_key)
+                if outcome is None:
+                    break
+            if outcome is not None:
+                if 'error' in outcome:
+                    raise requests.exceptions.RequestException(outcome['error'])
+                return outcome['value']
+
+            if time.monotonic() + delay > deadline:
+                raise CoalescedRequestTimeout(f'Timed out waiting for in-flight request {key}')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+
+def fetch_json(url, params=None):
+    """
+    GET `url` and return the decoded JSON. Identical concurrent calls
+    (same URL and parameters, in any order) share one upstream request,
+    within the process and, with UPSTREAM_COALESCE_SHARED, across
+    processes. Raises requests.exceptions.RequestException.
+    """
+    prepared = requests.Request('GET', url, params=params).prepare()
+    key = replay.request_key('GET', prepared.url, BASE_URL)
+    timeout = settings.UPSTREAM_COALESCE_TIMEOUT
+
+    def fetch():
+        response = session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    if settings.UPSTREAM_COALESCE_SHARED:
+        return single_flight.do(key, lambda: shared_single_flight(key, fetch, timeout), timeout)
+    return single_flight.do(key, fetch, timeout)
+
+
+class LocalLRUCache:
+    """Small thread-safe in-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Hot products are served from process memory for a few seconds before the
+# shared cache is consulted. Local edits only clear this worker's copy, so
+# the TTL bounds how long other workers can show the old version.
+local_products = LocalLRUCache(
+    max_size=getattr(settings, 'PRODUCT_CACHE_LOCAL_SIZE', 256),
+    ttl=getattr(settings, 'PRODUCT_CACHE_LOCAL_TTL', 5),
+)
+
+
+CATEGORIES_CACHE_KEY = 'upstream_categories'
+
+
+def get_categories():
+    """
+    Return the API category list, cached for PRODUCT_CACHE_FRESH_SECONDS
+    and dropped after every catalog sync.
+    Raises requests.exceptions.RequestException if the API fails.
+    """
+    categories = cache.get(CATEGORIES_CACHE_KEY)
+    if categories is None:
+        categories = fetch_json(f'{BASE_URL}categories')
+        cache.set(CATEGORIES_CACHE_KEY, categories, settings.PRODUCT_CACHE_FRESH_SECONDS)
+    return categories
+
+
+def product_cache_key(pk):
+    return f'upstream_product_{pk}'
+
+
+def get_product(pk):
+    """
+    Return the API data for product `pk`.
+
+    Responses are kept in the in-process LRU and the shared cache together
+    with their ETag/Last-Modified validators. An entry younger than
+    PRODUCT_CACHE_FRESH_SECONDS is used as-is; an older one is revalidated
+    with a conditional request, and a 304 answer costs no body transfer.
+    If the API fails, a cached copy is served if there is one.
+    Raises requests.exceptions.RequestException otherwise.
+    """
+    entry = local_products.get(pk)
+    if entry is not None:
+        return entry['body']
+
+    # Concurrent misses for the same product share one lookup
+    return single_flight.do(f'product {pk}', lambda: load_product(pk), settings.UPSTREAM_COALESCE_TIMEOUT)
+
+
+def load_product(pk, refresh=False):
+    """get_product without the in-process LRU; `refresh` revalidates even a fresh entry."""
+    key = product_cache_key(pk)
+    entry = cache.get(key)
+    if entry is not None and not refresh and time.time() - entry['fetched_at'] < settings.PRODUCT_CACHE_FRESH_SECONDS:
+        local_products.set(pk, entry)
+        return entry['body']
+
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        response = session.get(f'{BASE_URL}products/{pk}', headers=headers, timeout=30)
+        if response.status_code == 304 and entry is not None:
+            entry['fetched_at'] = time.time()
+        else:
+            response.raise_for_status()
+            entry = {
+                'body': response.json(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+            }
+    except requests.exceptions.RequestException as e:
+        # A 404 means the product is gone; other failures can use the stale copy
+        not_found = e.response is not None and e.response.status_code == 404
+        if not_found:
+            invalidate_product(pk)
+        if entry is None or not_found:
+            raise
+        return entry['body']
+
+    cache.set(key, entry, settings.PRODUCT_CACHE_MAX_AGE)
+    local_products.set(pk, entry)
+    return entry['body']
+
+
+def seed_products(products):
+    """
+    Store product data the API returned elsewhere (a list response, the
+    catalog mirror) as detail cache entries, for products not cached yet.
+    Returns the number of entries written.
+    """
+    keys = {product_cache_key(p['id']): p for p in products if local_products.get(p['id']) is None}
+    if not keys:
+        return 0
+    cached = cache.get_many(keys)
+    now = time.time()
+    entries = {
+        key: {'body': product, 'etag': None, 'last_modified': None, 'fetched_at': now}
+        for key, product in keys.items() if key not in cached
+    }
+    cache.set_many(entries, settings.PRODUCT_CACHE_MAX_AGE)
+    return len(entries)
+
+
+def invalidate_product(pk):
+    local_products.delete(pk)
+    cache.delete(product_cache_key(pk))
+
+
+@receiver(product_changed)
+def drop_changed_product(sender, product_id, **kwargs):
+    invalidate_product(product_id)
+
+
+@receiver(catalog_synced)
+def drop_categories(sender, **kwargs):
+    cache.delete(CATEGORIES_CACHE_KEY)
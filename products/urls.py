@@ -7,4 +7,6 @@ urlpatterns = [
     path('<int:pk>/', views.product_detail, name='product_detail'),
     path('<int:pk>/edit/', views.product_edit, name='product_edit'),
     path('<int:pk>/delete/', views.product_delete, name='product_delete'),
+    path('analytics/prices/', views.price_stats_api, name='product_price_stats'),
+    path('export.<str:fmt>', views.catalog_export, name='catalog_export'),
 ]
\ No newline at end of file
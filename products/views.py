@@ -1,21 +1,38 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import Http404, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import get_template, render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 import requests
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from core.query_budget import query_budget
+from . import catalog_io, outbox, prefetch, upstream
+from .analytics import DEFAULT_BINS, get_price_stats
 from .forms import ProductForm
+from .models import ProductMutation
+from .snapshot import filter_snapshot, get_list_snapshot
+from .upstream import BASE_URL
 
-BASE_URL = "https://api.escuelajs.co/api/v1/"
+# Number of product cards rendered and flushed per chunk when streaming
+PRODUCT_CARDS_CHUNK_SIZE = 24
+PRODUCT_CARDS_MARKER = mark_safe('<!--product-cards-->')
 
 def get_all_categories():
     """Helper function to fetch all categories from the API."""
     try:
-        response = requests.get(f'{BASE_URL}categories')
-        response.raise_for_status()
-        return response.json()
+        return upstream.get_categories()
     except requests.exceptions.RequestException as e:
         print(f"Error fetching categories: {e}")
         return None
 
+@query_budget(3)
 def product_list(request):
     search_query = request.GET.get('q')
     category_id = request.GET.get('category')
@@ -27,34 +44,109 @@ def product_list(request):
     if category_id:
         params['categoryId'] = category_id
 
+    snapshot = get_list_snapshot()
+    if snapshot is not None:
+        # Filter the in-memory catalog instead of calling the API
+        load_products = lambda: filter_snapshot(snapshot, request.GET)
+        categories = list(snapshot.categories)
+    else:
+        load_products = lambda: fetch_products(url, params)
+        categories = None
+
+    if settings.PRODUCT_DETAIL_SEED_LIMIT:
+        load_products = seeding_detail_cache(load_products)
+
+    if settings.PRODUCT_LIST_STREAMING:
+        return stream_product_list(request, load_products, categories)
+
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        products = response.json()
+        products = load_products()
     except requests.exceptions.RequestException as e:
         print(f"API request failed: {e}")
         products = []
         messages.error(request, f"Error al cargar productos: {e}")
 
-    categories = get_all_categories()
+    if categories is None:
+        categories = get_all_categories()
     if categories is None:
         messages.error(request, "Error al cargar categorías.")
         categories = []
 
     return render(request, 'products/product_list.html', {'products': products, 'categories': categories})
 
+def seeding_detail_cache(load_products):
+    """Wrap load_products so the first products listed also seed the detail cache."""
+    def load():
+        products = load_products()
+        prefetch.seed_from_list(products[:settings.PRODUCT_DETAIL_SEED_LIMIT])
+        return products
+    return load
+
+def fetch_products(url, params):
+    # Identical concurrent searches share one API request
+    return upstream.fetch_json(url, params)
+
+def stream_product_list(request, load_products, categories=None):
+    """
+    Streaming variant of product_list: the page shell (header, sidebar,
+    search form) is sent before the products are even fetched, and the cards
+    follow in chunks of PRODUCT_CARDS_CHUNK_SIZE, so the full page is never
+    held in memory.
+    """
+    if categories is None:
+        categories = get_all_categories()
+    if categories is None:
+        messages.error(request, "Error al cargar categorías.")
+        categories = []
+
+    # The shell is rendered before returning so that messages are consumed and
+    # the CSRF cookie is requested while the middleware can still act on them.
+    page = render_to_string('products/product_list.html', {
+        'products': [],
+        'categories': categories,
+        'stream_marker': PRODUCT_CARDS_MARKER,
+    }, request)
+    head, tail = page.split(PRODUCT_CARDS_MARKER, 1)
+    get_token(request)
+
+    return StreamingHttpResponse(render_product_cards(request, load_products, head, tail))
+
+def render_product_cards(request, load_products, head, tail):
+    yield head
+
+    try:
+        products = load_products()
+    except requests.exceptions.RequestException as e:
+        print(f"API request failed: {e}")
+        products = []
+        yield format_html(
+            '<div class="col-12"><div class="alert alert-error" role="alert">Error al cargar productos: {}</div></div>', e
+        )
+
+    cards_template = get_template('products/_product_cards.html')
+    for start in range(0, len(products), PRODUCT_CARDS_CHUNK_SIZE):
+        yield cards_template.render({'products': products[start:start + PRODUCT_CARDS_CHUNK_SIZE]}, request)
+
+    if not products:
+        yield render_to_string('products/_product_list_empty.html', request=request)
+
+    yield tail
+
+@query_budget(1)
 def product_detail(request, pk):
+    if prefetch.came_from_list(request):
+        prefetch.record_click(pk)
+
     try:
-        response = requests.get(f'{BASE_URL}products/{pk}')
-        response.raise_for_status()
-        product = response.json()
+        product = upstream.get_product(pk)
     except requests.exceptions.RequestException as e:
         print(f"API request failed: {e}")
-        product = None
         messages.error(request, f"Error al cargar el detalle del producto: {e}")
+        return redirect('product_list')
     
     return render(request, 'products/product_detail.html', {'product': product})
 
+@query_budget(6)
 @login_required(login_url='accounts:login')
 def product_create(request):
     categories = get_all_categories()
@@ -71,7 +163,7 @@ def product_create(request):
             if 'image' in request.FILES and request.FILES['image']:
                 file = request.FILES['image']
                 try:
-                    upload_response = requests.post(f'{BASE_URL}files/upload', files={'file': file})
+                    upload_response = upstream.session.post(f'{BASE_URL}files/upload', files={'file': file})
                     upload_response.raise_for_status()
                     image_url = upload_response.json().get('location')
                 except requests.exceptions.RequestException as e:
@@ -88,9 +180,14 @@ def product_create(request):
                     'categoryId': int(form.cleaned_data['categoryId']),
                     'images': images
                 }
-                
+
+                if settings.PRODUCTS_WRITE_BEHIND:
+                    outbox.enqueue(ProductMutation.CREATE, payload)
+                    messages.success(request, "¡Producto creado! Se publicará en la tienda en unos segundos.")
+                    return redirect('product_list')
+
                 try:
-                    response = requests.post(f'{BASE_URL}products/', json=payload)
+                    response = upstream.session.post(f'{BASE_URL}products/', json=payload)
                     response.raise_for_status()
                     messages.success(request, "¡Producto creado exitosamente!")
                     return redirect('product_list')
@@ -107,11 +204,10 @@ def product_create(request):
     
     return render(request, 'products/product_create.html', {'form': form})
 
+@query_budget(5)
 def product_edit(request, pk):
     try:
-        product_response = requests.get(f'{BASE_URL}products/{pk}')
-        product_response.raise_for_status()
-        product_data = product_response.json()
+        product_data = upstream.get_product(pk)
     except requests.exceptions.RequestException as e:
         messages.error(request, f"Error al cargar el producto para edición: {e}")
         return redirect('product_list')
@@ -121,8 +217,17 @@ def product_edit(request, pk):
         messages.error(request, "No se pueden cargar las categorías para editar el producto.")
         return redirect('product_list')
 
+    initial_data = {
+        'title': product_data.get('title'),
+        'price': product_data.get('price'),
+        'description': product_data.get('description'),
+        'categoryId': product_data.get('category', {}).get('id'),
+        'image_url': product_data.get('images', [None])[0]
+    }
+
     if request.method == 'POST':
-        form = ProductForm(request.POST, request.FILES, categories=categories, is_edit=True)
+        # categoryId is disabled, so its value comes from the initial data
+        form = ProductForm(request.POST, request.FILES, initial=initial_data, categories=categories, is_edit=True)
         if form.is_valid():
             image_urls = product_data.get('images', [])
             
@@ -131,7 +236,7 @@ def product_edit(request, pk):
             if 'image' in request.FILES and request.FILES['image']:
                 file = request.FILES['image']
                 try:
-                    upload_response = requests.post(f'{BASE_URL}files/upload', files={'file': file})
+                    upload_response = upstream.session.post(f'{BASE_URL}files/upload', files={'file': file})
                     upload_response.raise_for_status()
                     new_image_url = upload_response.json().get('location')
                 except requests.exceptions.RequestException as e:
@@ -148,10 +253,16 @@ def product_edit(request, pk):
                     'categoryId': int(form.cleaned_data['categoryId']),
                     'images': image_urls
                 }
-                
+
+                if settings.PRODUCTS_WRITE_BEHIND:
+                    outbox.enqueue(ProductMutation.UPDATE, payload, product_id=pk)
+                    messages.success(request, "¡Producto actualizado! Los cambios se publicarán en unos segundos.")
+                    return redirect('product_list')
+
                 try:
-                    response = requests.put(f'{BASE_URL}products/{pk}', json=payload)
+                    response = upstream.session.put(f'{BASE_URL}products/{pk}', json=payload)
                     response.raise_for_status()
+                    upstream.invalidate_product(pk)
                     messages.success(request, "¡Producto actualizado exitosamente!")
                     return redirect('product_list')
                 except requests.exceptions.RequestException as e:
@@ -160,25 +271,53 @@ def product_edit(request, pk):
         else:
             messages.error(request, "Por favor, corrija los errores en el formulario.")
     else:
-        initial_data = {
-            'title': product_data.get('title'),
-            'price': product_data.get('price'),
-            'description': product_data.get('description'),
-            'categoryId': product_data.get('category', {}).get('id'),
-            'image_url': product_data.get('images', [None])[0]
-        }
         form = ProductForm(initial=initial_data, categories=categories, is_edit=True)
     
     return render(request, 'products/product_edit.html', {'form': form, 'product': product_data})
 
+@query_budget(5)
 def product_delete(request, pk):
-    if request.method == 'POST':
+    if request.method == 'POST' and settings.PRODUCTS_WRITE_BEHIND:
+        outbox.enqueue(ProductMutation.DELETE, product_id=pk)
+        messages.success(request, "Producto eliminado exitosamente!")
+    elif request.method == 'POST':
         try:
-            response = requests.delete(f'{BASE_URL}products/{pk}')
+            response = upstream.session.delete(f'{BASE_URL}products/{pk}')
             response.raise_for_status()  # Raise an exception for bad status codes
+            upstream.invalidate_product(pk)
             messages.success(request, "Producto eliminado exitosamente!")
         except requests.exceptions.RequestException as e:
             print(f"API request failed: {e}")
             messages.error(request, f"Error al eliminar el producto: {e}")
     
     return redirect('product_list')
+
+@query_budget(4)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def price_stats_api(request):
+    """
+    Price statistics (count, min, max, mean, percentiles and a histogram)
+    for the whole catalog and per category, for merchandising dashboards.
+
+    Endpoint: GET /products/analytics/prices/?bins=10
+    """
+    try:
+        bins = int(request.GET.get('bins', DEFAULT_BINS))
+    except ValueError:
+        bins = 0
+    if not 1 <= bins <= 100:
+        return Response({'error': 'bins must be an integer between 1 and 100'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(get_price_stats(bins))
+
+@query_budget(3)
+@user_passes_test(lambda u: u.is_active and u.is_staff, login_url='accounts:login')
+def catalog_export(request, fmt):
+    """Streams the whole local catalog as CSV, JSONL or pcat."""
+    if fmt not in catalog_io.FORMATS:
+        raise Http404("Formato de exportación no soportado")
+
+    response = StreamingHttpResponse(catalog_io.export_catalog(fmt), content_type=catalog_io.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="catalog.{fmt}"'
+    return response